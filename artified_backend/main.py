@@ -3,6 +3,7 @@ import json
 import time
 import argparse
 from datetime import date as ddate
+from typing import List, Optional
 
 from .config import AppConfig
 from .utils_time import now_local, today_local_date, is_past_stop_time
@@ -113,11 +114,11 @@ def run_capture(cfg: AppConfig) -> str:
     return day_dir
 
 
-def build_all_artifacts(cfg: AppConfig, day_dir: str, day: ddate) -> dict:
+def build_all_artifacts(cfg: AppConfig, day_dir: str, day: ddate, image_names: Optional[List[str]] = None) -> dict:
     out_dir = artifacts_dir(day_dir, cfg.artifacts_dirname)
     ensure_dir(out_dir)
 
-    timeline_path = build_timeline(cfg, day_dir=day_dir, day_date=day, out_dir=out_dir)
+    timeline_path = build_timeline(cfg, day_dir=day_dir, day_date=day, out_dir=out_dir, image_names=image_names)
     feedback_path = build_feedback_events(cfg, timeline_path=timeline_path, out_dir=out_dir)
 
     google_path = None
@@ -10,6 +10,7 @@ from google import genai
 from google.genai import types
 
 from ..config import AppConfig
+from ..utils_genai import get_genai_client
 from ..utils_paths import ensure_dir
 
 
@@ -308,7 +309,7 @@ def build_daily_report(
         task_n = len(google_obj.get("tasks", {}).get("items", []))
         google_text = f"Calendar items: {cal_n}; Tasks due today: {task_n}."
 
-    client = genai.Client(api_key=api_key)
+    client = get_genai_client(api_key)
 
     vibe_prompt = _vibe_analysis_prompt(timeline_text, google_text)
     vibe = _call_gemini_text_json(cfg, client, vibe_prompt)
@@ -1,12 +1,15 @@
 import os
 import json
 import datetime
-from typing import Dict, Any
+import functools
+import threading
+from typing import Dict, Any, List
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 
 from ..config import AppConfig
 
@@ -14,9 +17,45 @@ from ..utils_paths import ensure_dir
 
 
 
+# Last loaded credentials, reused while the token file is unchanged (mtime/size).
+_CREDS_CACHE: Dict[str, Any] = {"key": None, "creds": None}
+# The cached Credentials object is shared by every caller; refresh + token-file write must not overlap.
+_CREDS_LOCK = threading.Lock()
+
+
+def _token_key(path: str):
+    try:
+        st = os.stat(path)
+        return path, st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _discovery_doc(api: str, version: str) -> Dict[str, Any]:
+    # bundled discovery JSON, read + parsed once per process
+    doc = get_static_doc(api, version)
+    if doc is None:
+        raise RuntimeError(f"No bundled discovery document for {api} {version}")
+    return json.loads(doc)
+
+
+def _build_service(api: str, version: str, creds: Credentials):
+    return build_from_document(_discovery_doc(api, version), credentials=creds)
+
+
 def _get_credentials(cfg: AppConfig) -> Credentials:
+    # refreshed (if needed) here, under the lock, before any service fans out requests with it
+    with _CREDS_LOCK:
+        return _load_or_refresh_credentials(cfg)
+
+
+def _load_or_refresh_credentials(cfg: AppConfig) -> Credentials:
     creds = None
-    if os.path.exists(cfg.google_token_file):
+    key = _token_key(cfg.google_token_file)
+    if key is not None and key == _CREDS_CACHE["key"]:
+        creds = _CREDS_CACHE["creds"]
+    elif key is not None:
         creds = Credentials.from_authorized_user_file(cfg.google_token_file, cfg.google_scopes)
 
     if not creds or not creds.valid:
@@ -38,13 +77,39 @@ def _get_credentials(cfg: AppConfig) -> Credentials:
         with open(cfg.google_token_file, "w", encoding="utf-8") as token:
             token.write(creds.to_json())
 
+    _CREDS_CACHE.update(key=_token_key(cfg.google_token_file), creds=creds)
     return creds
 
 
+# Google batch endpoints accept at most 100 calls per request.
+_BATCH_LIMIT = 100
+
+
+def _fetch_tasks_per_list(task_service, task_lists: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """tasks().list for every task list, sent as batched HTTP requests instead of one round-trip each."""
+    results: List[List[Dict[str, Any]]] = [[] for _ in task_lists]
+    errors: List[Exception] = []
+
+    def _on_tasks(request_id, response, exception):
+        if exception is not None:
+            errors.append(exception)
+            return
+        results[int(request_id)] = (response or {}).get("items", [])
+
+    for lo in range(0, len(task_lists), _BATCH_LIMIT):
+        batch = task_service.new_batch_http_request(callback=_on_tasks)
+        for i in range(lo, min(lo + _BATCH_LIMIT, len(task_lists))):
+            batch.add(task_service.tasks().list(tasklist=task_lists[i]["id"]), request_id=str(i))
+        batch.execute()
+        if errors:
+            raise errors[0]
+    return results
+
+
 def export_google_today(cfg: AppConfig, out_dir: str, day: datetime.date) -> str:
     creds = _get_credentials(cfg)
-    cal_service = build("calendar", "v3", credentials=creds)
-    task_service = build("tasks", "v1", credentials=creds)
+    cal_service = _build_service("calendar", "v3", creds)
+    task_service = _build_service("tasks", "v1", creds)
 
     day_str = day.isoformat()
 
@@ -81,8 +146,7 @@ def export_google_today(cfg: AppConfig, out_dir: str, day: datetime.date) -> str
         })
 
     task_lists = task_service.tasklists().list().execute().get("items", [])
-    for t_list in task_lists:
-        tasks = task_service.tasks().list(tasklist=t_list["id"]).execute().get("items", [])
+    for t_list, tasks in zip(task_lists, _fetch_tasks_per_list(task_service, task_lists)):
         for task in tasks:
             due_date = task.get("due")
             if due_date and due_date.startswith(day_str):
@@ -3,15 +3,15 @@ import json
 import time
 from dataclasses import dataclass
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Set, Tuple
 import re
 import random
 
 from PIL import Image
-from google import genai
 from google.genai import types
 
 from ..config import AppConfig
+from ..utils_genai import get_genai_client
 from ..utils_paths import ensure_dir
 
 
@@ -85,7 +85,7 @@ def _parse_time_from_filename(filename: str) -> Optional[Tuple[int, int, int]]:
         return None
 
 
-def _list_day_images(day_dir: str, day_date: date) -> List[Tuple[datetime, str]]:
+def _list_day_images(day_dir: str, day_date: date, names: Optional[List[str]] = None) -> List[Tuple[datetime, str]]:
     """
     Return list of (dt_local, filename) sorted by time.
     Supports:
@@ -98,7 +98,8 @@ def _list_day_images(day_dir: str, day_date: date) -> List[Tuple[datetime, str]]
         return []
 
     out: List[Tuple[datetime, str]] = []
-    names = sorted(os.listdir(day_dir))
+    # names: caller already knows the folder's files (e.g. the capture service) -> no listing
+    names = sorted(os.listdir(day_dir) if names is None else names)
 
     # common formats
     re_full = re.compile(r"^(?:shot|screenshot)_(\d{8})_(\d{6})\.(png|jpe?g)$", re.IGNORECASE)
@@ -368,11 +369,16 @@ def _merge_frames_into_segments(cfg: AppConfig, frames: List[FrameResult], day_d
         chunk = frames[start_idx:end_idx + 1]
         first = chunk[0]
 
+        # set for membership, list keeps first-seen order; only the first 3 are kept
         sup: List[str] = []
+        seen: Set[str] = set()
         for fr in chunk:
             for s in fr.supporting_surfaces:
-                if s not in sup and s != fr.dominant_surface:
+                if s not in seen and s != fr.dominant_surface:
+                    seen.add(s)
                     sup.append(s)
+            if len(sup) >= 3:
+                break
         sup = sup[:3]
 
         avg_conf = sum(fr.confidence for fr in chunk) / max(1, len(chunk))
@@ -488,12 +494,13 @@ def _segments_to_human_lines(segments: List[Dict[str, Any]]) -> List[str]:
     return lines
 
 
-def build_timeline(cfg: AppConfig, day_dir: str, day_date: date, out_dir: str) -> str:
+def build_timeline(cfg: AppConfig, day_dir: str, day_date: date, out_dir: str,
+                   image_names: Optional[List[str]] = None) -> str:
     api_key = cfg.gemini_api_key()
     if not api_key:
         raise RuntimeError(f"Missing Gemini API key. Please set env: {cfg.gemini_api_key_env}")
 
-    images = _list_day_images(day_dir, day_date)
+    images = _list_day_images(day_dir, day_date, image_names)
     if not images:
         raise RuntimeError(f"No images found in: {day_dir}")
 
@@ -506,7 +513,7 @@ def build_timeline(cfg: AppConfig, day_dir: str, day_date: date, out_dir: str) -
     print(f"[timeline] using {len(images)} frames (stride={stride}, max_frames={max_frames})")
     # -----------------------------------
 
-    client = genai.Client(api_key=api_key)
+    client = get_genai_client(api_key)
 
     first_path = os.path.join(day_dir, images[0][1])
     screen_w, screen_h = _read_image_size(first_path)
@@ -1,18 +1,23 @@
 # artified_backend/serve.py
 import os
 import json
+import asyncio
 import time
+import hashlib
+import shutil
 import secrets
 import sys
+import queue
 import threading
-from datetime import datetime, date as ddate
-from typing import Optional, List, Dict, Any
+from datetime import datetime, date as ddate, time as dtime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from zoneinfo import ZoneInfo
 
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, ORJSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -32,6 +37,12 @@ from .pipelines.google_export_pipeline import export_google_today
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
 
+# faster JSON encode/decode when available; stdlib json otherwise
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 
 def resource_path(rel_path: str) -> str:
     """
@@ -42,7 +53,7 @@ def resource_path(rel_path: str) -> str:
     return os.path.join(base, rel_path)
 
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse if orjson else JSONResponse)
 cfg = AppConfig()
 
 # ✅ unified data root
@@ -99,22 +110,21 @@ else:
 # ----------------------------
 # Helpers: day dirs / artifacts
 # ----------------------------
+def _subdirs(path: str) -> list[str]:
+    with os.scandir(path) as it:
+        return sorted(e.name for e in it if e.is_dir())
+
+
 def _list_day_dirs(root: str) -> list[str]:
     out = []
     if not os.path.isdir(root):
         return out
-    for y in sorted(os.listdir(root)):
+    for y in _subdirs(root):
         ydir = os.path.join(root, y)
-        if not os.path.isdir(ydir):
-            continue
-        for mon in sorted(os.listdir(ydir)):
+        for mon in _subdirs(ydir):
             mdir = os.path.join(ydir, mon)
-            if not os.path.isdir(mdir):
-                continue
-            for dd in sorted(os.listdir(mdir)):
-                ddir = os.path.join(mdir, dd)
-                if os.path.isdir(ddir):
-                    out.append(ddir)
+            for dd in _subdirs(mdir):
+                out.append(os.path.join(mdir, dd))
     return out
 
 
@@ -132,25 +142,55 @@ def _parse_day_dir_to_date(day_dir: str) -> Optional[ddate]:
         return None
 
 
+# latest day dir + the mtimes of root / its year dir / its month dir when it was found.
+# A new day folder bumps the month mtime, a new month the year mtime, a new year the root's.
+_LATEST_CACHE: dict = {"root": None, "path": None, "key": None}
+
+
+def _latest_key(root: str, day_dir: Optional[str]) -> Optional[tuple]:
+    try:
+        key = (os.stat(root).st_mtime_ns,)
+        if day_dir:
+            mdir = os.path.dirname(day_dir)
+            key += (os.stat(os.path.dirname(mdir)).st_mtime_ns, os.stat(mdir).st_mtime_ns)
+        return key
+    except OSError:
+        return None
+
+
 def _latest_day_dir(root: str) -> Optional[str]:
+    c = _LATEST_CACHE
+    if c["root"] == root and c["key"] is not None and _latest_key(root, c["path"]) == c["key"]:
+        return c["path"]
+
     day_dirs = _list_day_dirs(root)
     dated = []
     for ddir in day_dirs:
         dt = _parse_day_dir_to_date(ddir)
         if dt:
             dated.append((dt, ddir))
-    if not dated:
-        return None
-    dated.sort(key=lambda x: x[0])
-    return dated[-1][1]
+    latest = None
+    if dated:
+        dated.sort(key=lambda x: x[0])
+        latest = dated[-1][1]
+
+    c.update(root=root, path=latest, key=_latest_key(root, latest))
+    return latest
 
 
 def _read_json(path: str) -> dict:
+    if orjson:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
 def _write_json(path: str, data: dict):
+    if orjson:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
@@ -507,6 +547,45 @@ except Exception:
     Image = None
 
 
+# append-only per-day index of captured files, written by the encoder thread
+SHOTS_INDEX_NAME = "shots_index.jsonl"
+
+
+def _read_shots_index(day_dir: str) -> Optional[List[str]]:
+    """Return filenames recorded in the day's shots index, or None if there is no index."""
+    path = os.path.join(day_dir, SHOTS_INDEX_NAME)
+    if not os.path.exists(path):
+        return None
+    names: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                name = json.loads(line).get("file")
+            except Exception:
+                continue
+            if isinstance(name, str) and name:
+                names.append(name)
+    return names
+
+
+def _scan_images(day_dir: str) -> List[str]:
+    # scandir hands back names + d_type without a stat per entry
+    with os.scandir(day_dir) as it:
+        return [e.name for e in it if e.name.lower().endswith((".png", ".jpg", ".jpeg")) and e.is_file()]
+
+
+def _list_shot_names(day_dir: str) -> List[str]:
+    """
+    Image filenames in day_dir: indexed files in capture order, then any the index missed.
+    The shots index is only a hint, since files can be written without an index line
+    (failed append, services/recorder.py, simulated days), so the scan decides what exists.
+    """
+    on_disk = set(_scan_images(day_dir))
+    names = [n for n in dict.fromkeys(_read_shots_index(day_dir) or []) if n in on_disk]
+    names.extend(sorted(on_disk.difference(names)))
+    return names
+
+
 class CaptureManager:
     def __init__(self):
         self._lock = threading.Lock()
@@ -518,17 +597,39 @@ class CaptureManager:
         self.last_shot_ts: Optional[float] = None
         self.interval_sec = 60
         self.last_block: Optional[Dict[str, Any]] = None
+        # frames waiting for PNG encode; bounded so a slow disk drops samples instead of piling up RAM
+        self._enc_q: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=4)
+        self._enc_thread: Optional[threading.Thread] = None
+        # identical consecutive frames are hard-linked to the previous file instead of re-encoded;
+        # (frame hash, path) of the last file the encoder actually wrote, set as one tuple
+        self._last_written: Optional[Tuple[bytes, str]] = None
+        # day folder only changes at midnight; avoid a makedirs per tick
+        self._cached_day: Optional[Tuple[int, int, int]] = None
+        self._cached_ddir: Optional[str] = None
+        self._date_prefix = ""
+        self._sct = None  # mss handle, owned by the capture thread for the whole session
+        # filenames captured into the current day folder, kept by the encoder so builds need no listing
+        self._today_dir: Optional[str] = None
+        self._today_names: List[str] = []
 
     def status(self) -> Dict[str, Any]:
+        # copy under the lock, format outside it so status polling never stalls the capture thread
         with self._lock:
-            return {
-                "running": self.running,
-                "paused": self.paused,
-                "interval_sec": self.interval_sec,
-                "started_ts": datetime.fromtimestamp(self.started_ts).isoformat() if self.started_ts else None,
-                "last_shot_ts": datetime.fromtimestamp(self.last_shot_ts).isoformat() if self.last_shot_ts else None,
-                "last_block": self.last_block,
-            }
+            running = self.running
+            paused = self.paused
+            interval_sec = self.interval_sec
+            started_ts = self.started_ts
+            last_shot_ts = self.last_shot_ts
+            last_block = self.last_block
+
+        return {
+            "running": running,
+            "paused": paused,
+            "interval_sec": interval_sec,
+            "started_ts": datetime.fromtimestamp(started_ts).isoformat() if started_ts else None,
+            "last_shot_ts": datetime.fromtimestamp(last_shot_ts).isoformat() if last_shot_ts else None,
+            "last_block": last_block,
+        }
 
     def start(self, interval_sec: int = 10):
         if mss is None or Image is None:
@@ -543,7 +644,13 @@ class CaptureManager:
             self.last_block = None
             self.started_ts = time.time()
             self._stop_evt.clear()
-            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._last_written = None
+            self._cached_day = None
+            # one encoder keeps files written in capture order
+            self._enc_q = queue.Queue(maxsize=4)
+            self._enc_thread = threading.Thread(target=self._encoder_worker, args=(self._enc_q,), daemon=True)
+            self._enc_thread.start()
+            self._thread = threading.Thread(target=self._loop, args=(self._enc_q,), daemon=True)
             self._thread.start()
 
     def stop(self):
@@ -566,22 +673,103 @@ class CaptureManager:
         os.makedirs(ddir, exist_ok=True)
         return ddir
 
-    def _capture_once(self) -> str:
-        dt = ddate.today()
-        ddir = self._ensure_day_dir(dt)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        out_path = os.path.join(ddir, f"shot_{ts}.png")
+    def _capture_once(self, enc_q: "queue.Queue") -> Optional[str]:
+        now = time.time()
+        lt = time.localtime(now)
+        day_key = (lt.tm_year, lt.tm_mon, lt.tm_mday)
+        if day_key != self._cached_day or not self._cached_ddir:
+            self._cached_ddir = self._ensure_day_dir(ddate(*day_key))
+            self._cached_day = day_key
+            self._date_prefix = time.strftime("%Y%m%d_", lt)
+        ts = f"{self._date_prefix}{lt.tm_hour:02d}{lt.tm_min:02d}{lt.tm_sec:02d}"
+        out_path = os.path.join(self._cached_ddir, f"shot_{ts}.png")
+
+        shot = self._sct.grab(self._sct.monitors[1])  # main display
+        frame_hash = hashlib.blake2b(shot.bgra, digest_size=16).digest()
+        last = self._last_written
+        if last is not None and last[0] == frame_hash:
+            job = (out_path, None, last[1], now, frame_hash)
+        else:
+            # decode straight from the native BGRA buffer; shot.rgb would build an extra swizzled copy first
+            img = Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+            job = (out_path, img, None, now, frame_hash)
+
+        # PNG encode + write happen on the encoder thread so the next tick stays on schedule
+        try:
+            enc_q.put_nowait(job)
+        except queue.Full:
+            print("[CAPTURE] encoder busy, dropped:", out_path)
+            return None
+        return out_path
+
+    def _encoder_worker(self, enc_q: "queue.Queue"):
+        while True:
+            job = enc_q.get()
+            if job is None:
+                return
+            out_path, img, same_as, shot_ts, frame_hash = job
+            try:
+                if same_as:
+                    try:
+                        os.link(same_as, out_path)
+                    except OSError:
+                        shutil.copyfile(same_as, out_path)
+                    print("[CAPTURE] unchanged, linked:", out_path)
+                else:
+                    img.save(out_path, compress_level=1)
+                    print("[CAPTURE] saved:", out_path)
+            except Exception as e:
+                print("[CAPTURE] save failed:", out_path, repr(e))
+                # nothing valid to link to any more: the next frame is encoded from scratch
+                self._last_written = None
+                continue
+            # only a file that is really on disk becomes the link target for identical frames
+            self._last_written = (frame_hash, out_path)
 
-        with mss.mss() as sct:
-            monitor = sct.monitors[1]  # main display
-            shot = sct.grab(monitor)
-            img = Image.frombytes("RGB", shot.size, shot.rgb)
-            img.save(out_path)
+            try:
+                index_path = os.path.join(os.path.dirname(out_path), SHOTS_INDEX_NAME)
+                with open(index_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"ts": round(shot_ts, 3), "file": os.path.basename(out_path)}) + "\n")
+            except Exception as e:
+                print("[CAPTURE] index append failed:", repr(e))
 
-        print("[CAPTURE] saved:", out_path)
-        return out_path
+            self._note_captured(out_path)
 
-    def _loop(self):
+    def _note_captured(self, out_path: str):
+        ddir, name = os.path.split(out_path)
+        if ddir == self._today_dir:
+            with self._lock:
+                self._today_names.append(name)
+            return
+        # first file in this folder for the session: seed from disk once (index + scan, includes out_path)
+        try:
+            names = _list_shot_names(ddir)
+        except Exception:
+            names = [name]
+        with self._lock:
+            self._today_dir = ddir
+            self._today_names = names
+
+    def today_names(self, day_dir: str) -> Optional[List[str]]:
+        """Captured filenames for day_dir if the encoder is tracking that folder, else None."""
+        with self._lock:
+            if day_dir != self._today_dir:
+                return None
+            return list(self._today_names)
+
+    def _loop(self, enc_q: "queue.Queue"):
+        try:
+            # mss handles are bound to the thread that opened them, so open it here rather than in start()
+            self._sct = mss.mss()
+            self._run(enc_q)
+        finally:
+            if self._sct is not None:
+                self._sct.close()
+                self._sct = None
+            # let the encoder flush what is queued, then exit
+            enc_q.put(None)
+
+    def _run(self, enc_q: "queue.Queue"):
         _reload_privacy_into_cfg()
 
         while not self._stop_evt.is_set():
@@ -615,13 +803,14 @@ class CaptureManager:
                                 "window_title": info.window_title,
                                 "app_name": info.app_name,
                                 "url": info.url,
-                                "ts": datetime.now().isoformat(timespec="seconds"),
+                                "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
                             }
                         print("[CAPTURE] paused by blacklist:", self.last_block)
                     else:
-                        _ = self._capture_once()
+                        shot_path = self._capture_once(enc_q)
                         with self._lock:
-                            self.last_shot_ts = time.time()
+                            if shot_path:
+                                self.last_shot_ts = time.time()
                             self.last_block = None
                 except Exception:
                     pass
@@ -682,18 +871,26 @@ def capture_pause(body: Dict[str, Any] = None):
 # ============================================================
 # Build (no subprocess)
 # ============================================================
+# Builds (HTTP + midnight scheduler) share one worker: they serialize and
+# never run on the event loop, so status polling stays responsive.
+BUILD_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="build")
+
+
 def _build_for_date(day: ddate, *, with_redraw: bool) -> Dict[str, Any]:
     ddir = day_folder(cfg.screenshot_root, day)
     os.makedirs(ddir, exist_ok=True)
 
     try:
-        imgs = [x for x in os.listdir(ddir) if x.lower().endswith((".png", ".jpg", ".jpeg"))]
+        imgs = CAP.today_names(ddir) if day == ddate.today() else None
+        if imgs is None:
+            imgs = _list_shot_names(ddir)
     except Exception:
-        imgs = []
-    print("[BUILD] day_dir:", ddir, "images:", len(imgs), "with_redraw:", with_redraw)
+        imgs = None
+    print("[BUILD] day_dir:", ddir, "images:", len(imgs or []), "with_redraw:", with_redraw)
 
     try:
-        result = build_all_artifacts(cfg, day_dir=ddir, day=day)
+        # hand the known filenames to the timeline so it does not list the folder again
+        result = build_all_artifacts(cfg, day_dir=ddir, day=day, image_names=imgs)
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"build failed: {type(e).__name__}: {e}")
@@ -712,14 +909,19 @@ def _build_for_date(day: ddate, *, with_redraw: bool) -> Dict[str, Any]:
     }
 
 
+async def _build_async(day: ddate, *, with_redraw: bool) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(BUILD_POOL, lambda: _build_for_date(day, with_redraw=with_redraw))
+
+
 @app.post("/api/build/today")
-def api_build_today():
+async def api_build_today():
     # Build Today = full build (with redraw)
-    return _build_for_date(ddate.today(), with_redraw=True)
+    return await _build_async(ddate.today(), with_redraw=True)
 
 
 @app.post("/api/build/latest")
-def api_build_latest_full():
+async def api_build_latest_full():
     # Keep old endpoint (full build) if you still need it somewhere
     latest = _latest_day_dir(cfg.screenshot_root)
     if not latest:
@@ -727,11 +929,11 @@ def api_build_latest_full():
     dt = _parse_day_dir_to_date(latest)
     if not dt:
         raise HTTPException(status_code=500, detail="latest day dir parse failed")
-    return _build_for_date(dt, with_redraw=True)
+    return await _build_async(dt, with_redraw=True)
 
 
 @app.post("/api/build")
-def api_build_latest_no_redraw():
+async def api_build_latest_no_redraw():
     """
     Build = latest day, but NO redraw image
     """
@@ -741,7 +943,7 @@ def api_build_latest_no_redraw():
     dt = _parse_day_dir_to_date(latest)
     if not dt:
         raise HTTPException(status_code=500, detail="latest day dir parse failed")
-    return _build_for_date(dt, with_redraw=False)
+    return await _build_async(dt, with_redraw=False)
 
 
 # ============================================================
@@ -772,8 +974,7 @@ def _save_google_token(creds: Credentials):
         "scopes": creds.scopes,
     }
     os.makedirs(os.path.dirname(GOOGLE_TOKEN_PATH) or ".", exist_ok=True)
-    with open(GOOGLE_TOKEN_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    _write_json(GOOGLE_TOKEN_PATH, data)
 
 
 def _has_google_token() -> bool:
@@ -907,9 +1108,9 @@ _SCHED_THREAD: Optional[threading.Thread] = None
 def _seconds_until_next_midnight(tz_name: str) -> float:
     tz = ZoneInfo(tz_name or "America/Los_Angeles")
     now = datetime.now(tz)
-    tomorrow = (now.date()).toordinal() + 1
-    next_midnight = datetime.fromordinal(tomorrow).replace(tzinfo=tz)  # 00:00:00 tomorrow
-    delta = (next_midnight - now).total_seconds()
+    next_midnight = datetime.combine(now.date() + timedelta(days=1), dtime.min, tzinfo=tz)  # 00:00:00 tomorrow
+    # via timestamps: same-tz aware subtraction is wall-clock and is off by an hour across DST
+    delta = next_midnight.timestamp() - now.timestamp()
     # safety floor
     return max(1.0, float(delta))
 
@@ -920,12 +1121,15 @@ def _midnight_loop():
             wait_sec = _seconds_until_next_midnight(cfg.timezone_name)
             print(f"[SCHED] next run in {wait_sec:.1f}s (tz={cfg.timezone_name})")
 
-            # wait with interrupt ability
-            t0 = time.time()
-            while time.time() - t0 < wait_sec:
-                if _SCHED_STOP.is_set():
+            # Event.wait runs on the monotonic clock, which stops during suspend: wait in short
+            # slices against the wall-clock target so a laptop waking after midnight runs right away
+            # (re-asking for "next midnight" after waking would skip ahead to tomorrow's)
+            target_ts = time.time() + wait_sec
+            remaining = wait_sec
+            while remaining > 0:
+                if _SCHED_STOP.wait(timeout=min(remaining, 60.0)):
                     return
-                time.sleep(0.5)
+                remaining = target_ts - time.time()
 
             # === it's midnight ===
             print("[SCHED] midnight reached -> stop capture + build today")
@@ -938,14 +1142,14 @@ def _midnight_loop():
 
             # 2) build today WITH redraw
             try:
-                _ = _build_for_date(ddate.today(), with_redraw=True)
+                _ = BUILD_POOL.submit(_build_for_date, ddate.today(), with_redraw=True).result()
                 print("[SCHED] build today done")
             except Exception as e:
                 print("[SCHED] build today failed:", repr(e))
 
         except Exception as e:
             print("[SCHED] scheduler loop error:", repr(e))
-            time.sleep(2.0)
+            _SCHED_STOP.wait(2.0)
 
 @app.on_event("startup")
 def _startup_scheduler():
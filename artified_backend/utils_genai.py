@@ -0,0 +1,10 @@
+import functools
+
+from google import genai
+
+
+@functools.lru_cache(maxsize=None)
+def get_genai_client(api_key: str) -> genai.Client:
+    # one client per API key for the whole process: every pipeline run reuses its
+    # HTTP connection pool (keep-alive, no new TLS handshake per run)
+    return genai.Client(api_key=api_key)
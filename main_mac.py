@@ -54,6 +54,9 @@ def main():
 
     except KeyboardInterrupt:
         print("\n👋 程序已退出。")
+    finally:
+        # 把还在排队的截图写完再退出
+        recorder.close()
 
 
 if __name__ == "__main__":
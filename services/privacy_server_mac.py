@@ -2,8 +2,32 @@ import threading
 import subprocess
 import json
 import os
+import re
+from urllib.parse import urlsplit
 from flask import Flask, request, jsonify
 
+try:
+    import ahocorasick  # pyahocorasick，可选；没有就退回到单个正则
+except Exception:
+    ahocorasick = None
+
+try:
+    import orjson  # 可选：更快的 JSON 解析
+except Exception:
+    orjson = None
+
+try:
+    import re2 as _kw_re  # google-re2，可选；DFA 匹配，无回溯
+except Exception:
+    _kw_re = re
+
+try:
+    # pyobjc-framework-Cocoa：进程内直接问 NSWorkspace，不用每次起 osascript
+    from AppKit import NSWorkspace
+    from Foundation import NSDate, NSRunLoop
+except Exception:
+    NSWorkspace = None
+
 
 # === 配置文件路径 ===
 CONFIG_FILE = "privacy_config.json"
@@ -20,14 +44,67 @@ TEMPLATE_CONFIG = {
 }
 
 # 全局配置变量
-CURRENT_CONFIG = {"blocked_apps": [], "blocked_keywords": []}
+CURRENT_CONFIG = {"blocked_apps": [], "blocked_keywords": [], "blocked_apps_set": frozenset()}
+
+# 关键词匹配器：配置加载时构建一次，每个 URL 只需扫描一遍 (url -> 命中的关键词 / None)
+_KW_MATCHER = None
+# 形如域名的关键词（小写 -> 原关键词）：先用 URL 的 host 做一次哈希查找，命中就不必再扫描
+_KW_EXACT = {}
+_HOSTLIKE_RE = re.compile(r"[a-z0-9.-]+")
+# 已加载配置文件的 (st_mtime_ns, st_size)，用于判断是否需要重新加载
+_CONFIG_STAMP = None
+
+
+def _build_keyword_matcher(words):
+    words = [w for w in words if isinstance(w, str) and w]
+    if not words:
+        return None
+
+    if ahocorasick is not None:
+        automaton = ahocorasick.Automaton()
+        for w in words:
+            automaton.add_word(w.lower(), w)
+        automaton.make_automaton()
+        return lambda url: next((v for _, v in automaton.iter(url)), None)
+
+    # 退路：所有关键词合成一个正则交替（有 re2 就用 re2 编译）
+    by_lower = {w.lower(): w for w in words}
+    pattern = _kw_re.compile("|".join(re.escape(w) for w in by_lower))
+
+    def match(url):
+        m = pattern.search(url)
+        return by_lower[m.group(0)] if m else None
+
+    return match
+
+
+def match_blocked_keyword(url):
+    """url 需已小写；返回命中的关键词或 None"""
+    if _KW_EXACT:
+        try:
+            host = urlsplit(url).hostname
+        except ValueError:
+            host = None
+        hit = _KW_EXACT.get(host)
+        if hit:
+            return hit
+    matcher = _KW_MATCHER
+    return matcher(url) if matcher else None
+
+
+def _config_stamp():
+    try:
+        st = os.stat(CONFIG_FILE)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
 
 
 def load_or_create_config():
     """
     加载配置文件。如果不存在，生成一个空的模板供用户填写。
     """
-    global CURRENT_CONFIG
+    global CURRENT_CONFIG, _KW_MATCHER, _KW_EXACT, _CONFIG_STAMP
     try:
         if not os.path.exists(CONFIG_FILE):
             print(f"🆕 [Config] 初始化: 未找到配置，正在生成模板文件 -> {CONFIG_FILE}")
@@ -37,30 +114,57 @@ def load_or_create_config():
                 json.dump(TEMPLATE_CONFIG, f, indent = 4, ensure_ascii = False)
 
             # 初始状态设为空，避免拦截示例值
-            CURRENT_CONFIG = {"blocked_apps": [], "blocked_keywords": []}
+            config = {"blocked_apps": [], "blocked_keywords": []}
         else:
-            with open(CONFIG_FILE, 'r', encoding = 'utf-8') as f:
-                CURRENT_CONFIG = json.load(f)
+            with open(CONFIG_FILE, 'rb') as f:
+                raw = f.read()
+                config = orjson.loads(raw) if orjson else json.loads(raw.decode('utf-8'))
 
                 # 过滤掉示例值 (可选优化)
-                apps = [a for a in CURRENT_CONFIG.get("blocked_apps", []) if
+                apps = [a for a in config.get("blocked_apps", []) if
                         a != "ExampleApp_Name_Here"]
-                words = [w for w in CURRENT_CONFIG.get("blocked_keywords", []) if
+                words = [w for w in config.get("blocked_keywords", []) if
                          w != "example_keyword"]
 
-                CURRENT_CONFIG["blocked_apps"] = apps
-                CURRENT_CONFIG["blocked_keywords"] = words
+                config["blocked_apps"] = apps
+                config["blocked_keywords"] = words
 
                 print(f"⚙️ [Config] 已加载用户配置: {len(apps)} 个应用, {len(words)} 个关键词")
 
     except Exception as e:
         print(f"⚠️ [Config] 配置文件加载失败 ({e})，隐私保护可能暂时失效。")
-        CURRENT_CONFIG = {"blocked_apps": [], "blocked_keywords": []}
+        config = {"blocked_apps": [], "blocked_keywords": []}
+
+    # 先构建好再整体替换，请求线程不会看到半更新的状态
+    # 列表保留用于序列化，判断时用 frozenset 做哈希查找
+    config["blocked_apps_set"] = frozenset(a for a in config["blocked_apps"] if isinstance(a, str))
+    words = config["blocked_keywords"]
+    matcher = _build_keyword_matcher(words)
+    exact = {w.lower(): w for w in words
+             if isinstance(w, str) and _HOSTLIKE_RE.fullmatch(w.lower())}
+    CURRENT_CONFIG, _KW_MATCHER, _KW_EXACT = config, matcher, exact
+    _CONFIG_STAMP = _config_stamp()
+
+
+def maybe_reload():
+    """配置文件被修改（mtime/大小变化）时重新加载；未变化时只有一次 stat"""
+    if _config_stamp() != _CONFIG_STAMP:
+        load_or_create_config()
 
 
 # --- 工具函数 ---
 def get_active_app_name():
-    """使用 AppleScript 获取前台应用名"""
+    """获取前台应用名：优先 NSWorkspace，失败时退回 AppleScript"""
+    if NSWorkspace is not None:
+        try:
+            # 没有常驻 run loop 时 frontmostApplication 不会刷新，先把挂起的通知处理掉
+            NSRunLoop.currentRunLoop().runUntilDate_(NSDate.date())
+            front = NSWorkspace.sharedWorkspace().frontmostApplication()
+            if front is not None:
+                return front.localizedName()
+        except Exception:
+            pass
+
     script = 'tell application "System Events" to get name of first application process whose frontmost is true'
     try:
         result = subprocess.run(["osascript", "-e", script], capture_output = True, text = True)
@@ -71,13 +175,14 @@ def get_active_app_name():
 
 def is_native_app_sensitive():
     """检查本地应用是否在配置的黑名单中"""
+    maybe_reload()
     app_name = get_active_app_name()
 
     # [调试提示]
     # 如果你想让用户知道当前打开的App叫什么名字(方便他们填配置)，可以取消下面这行的注释
     # print(f"Current App: {app_name}")
 
-    if app_name in CURRENT_CONFIG.get("blocked_apps", []):
+    if app_name in CURRENT_CONFIG.get("blocked_apps_set", ()):
         return True, app_name
     return False, app_name
 
@@ -99,12 +204,10 @@ class MacPrivacyMonitor:
             try:
                 data = request.json
                 url = data.get('url', '').lower()
+                maybe_reload()
 
-                # 获取配置
-                keywords = CURRENT_CONFIG.get("blocked_keywords", [])
-
-                # 匹配逻辑
-                matched_keyword = next((word for word in keywords if word in url), None)
+                # 匹配逻辑（host 哈希查找 + 预编译的匹配器，一次扫描）
+                matched_keyword = match_blocked_keyword(url)
 
                 if matched_keyword:
                     if not self.is_paused:
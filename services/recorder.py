@@ -1,14 +1,25 @@
 import os
+import queue
+import threading
 from datetime import datetime
 from PIL import ImageGrab
 
 class ScreenRecorder:
     def __init__(self, root_dir="screenshots"):
         self.root_dir = root_dir
+        # 截图后交给后台线程做 PNG 编码 + 写盘，主循环只负责抓像素
+        self._q = queue.Queue(maxsize=8)
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+        self._cached_day = None
+        self._cached_path = None
 
-    def _ensure_daily_folder(self):
-        """内部方法：确保当天的文件夹存在"""
-        now = datetime.now()
+    def _ensure_daily_folder(self, now=None):
+        """内部方法：确保当天的文件夹存在（同一天内直接用缓存的路径）"""
+        now = now or datetime.now()
+        today = now.date()
+        if today == self._cached_day:
+            return self._cached_path
         # 路径结构: screenshots/2026/February/02
         path = os.path.join(
             self.root_dir,
@@ -16,23 +27,48 @@ class ScreenRecorder:
             now.strftime("%B"),
             now.strftime("%d")
         )
-        if not os.path.exists(path):
-            os.makedirs(path)
+        os.makedirs(path, exist_ok=True)
+        self._cached_day, self._cached_path = today, path
         return path
 
+    def _writer_loop(self):
+        while True:
+            job = self._q.get()
+            if job is None:  # close() 发来的结束信号：前面排队的截图都已写完
+                return
+            filepath, timestamp, screenshot = job
+            try:
+                # macOS 上 grab 出来是 RGBA：去掉 alpha，少压缩 1/4 的数据
+                if screenshot.mode != "RGB":
+                    screenshot = screenshot.convert("RGB")
+                # compress_level=1：编码快很多，文件只稍大一点
+                screenshot.save(filepath, format="PNG", compress_level=1)
+                print(f"📸 [{timestamp}] 截图已保存")
+            except Exception as e:
+                print(f"❌ [Recorder] 截图保存失败: {e}")
+
+    def close(self):
+        """退出前调用：等后台线程把队列里剩下的截图写完再返回"""
+        self._q.put(None)
+        self._writer.join()
+
     def take_screenshot(self):
-        """执行一次截图并保存"""
+        """执行一次截图，保存交给后台线程"""
         try:
-            save_dir = self._ensure_daily_folder()
-            timestamp = datetime.now().strftime("%H-%M-%S")
+            now = datetime.now()
+            save_dir = self._ensure_daily_folder(now)
+            timestamp = now.strftime("%H-%M-%S")
             filename = f"{timestamp}.png"
             filepath = os.path.join(save_dir, filename)
 
             # 截图核心
             screenshot = ImageGrab.grab()
-            screenshot.save(filepath)
-            print(f"📸 [{timestamp}] 截图已保存")
+            try:
+                self._q.put_nowait((filepath, timestamp, screenshot))
+            except queue.Full:
+                print(f"⚠️ [{timestamp}] 写盘跟不上，丢弃本次截图")
+                return False
             return True
         except Exception as e:
             print(f"❌ [Recorder] 截图失败: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -1,45 +1,154 @@
 import pygetwindow as gw
 import time
 import os
+import sys
+import ctypes
+from ctypes import wintypes
+
+# WinEvent 相关常量
+EVENT_SYSTEM_FOREGROUND = 0x0003
+EVENT_OBJECT_DESTROY = 0x8001
+EVENT_OBJECT_HIDE = 0x8003  # DESTROY..HIDE 覆盖 destroy / show / hide
+EVENT_OBJECT_NAMECHANGE = 0x800C
+WINEVENT_OUTOFCONTEXT = 0x0000
+WINEVENT_SKIPOWNPROCESS = 0x0002
+OBJID_WINDOW = 0
+WM_QUIT = 0x0012
+
+if sys.platform == "win32":
+    _user32 = ctypes.windll.user32
+    _kernel32 = ctypes.windll.kernel32
+    _EnumWindowsProc = ctypes.WINFUNCTYPE(ctypes.c_bool, ctypes.c_void_p, ctypes.c_void_p)
+    _WinEventProc = ctypes.WINFUNCTYPE(
+        None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+        wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD
+    )
+    _CtrlHandler = ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.DWORD)
+
+
+def _find_visible_window_win32(keyword_l):
+    """
+    直接用 Win32 EnumWindows 枚举一遍：先过滤不可见窗口，再读标题，命中即停止枚举
+    """
+    found = []
+
+    def _on_window(hwnd, _lparam):
+        if not _user32.IsWindowVisible(hwnd):
+            return True
+        n = _user32.GetWindowTextLengthW(hwnd)
+        if n <= 0:
+            return True
+        buf = ctypes.create_unicode_buffer(n + 1)
+        _user32.GetWindowTextW(hwnd, buf, n + 1)
+        title = buf.value
+        if title and keyword_l in title.lower():
+            found.append(title)
+            return False  # 停止枚举
+        return True
+
+    _user32.EnumWindows(_EnumWindowsProc(_on_window), None)
+    return (True, found[0]) if found else (False, None)
+
 
 def is_app_running_as_window(app_name_keyword):
     """
     只检测 '应用' 栏：通过查找系统当前所有可见的窗口标题来判断
     """
-    # 获取当前桌面上所有窗口的标题
-    all_windows = gw.getAllTitles()
-    
-    for title in all_windows:
+    if sys.platform == "win32":
+        return _find_visible_window_win32(app_name_keyword.lower())
+
+    # 一次性枚举所有窗口，直接读取标题和可见性（避免每个命中标题再全量枚举一次）
+    keyword_l = app_name_keyword.lower()
+    for window in gw.getAllWindows():
+        title = window.title
         # 只要标题中包含“微信”且窗口不是空的
-        if title and app_name_keyword in title:
-            # 进一步确认该窗口是否真的“可见”（在应用栏显示）
-            window = gw.getWindowsWithTitle(title)[0]
-            if window.visible:
-                return True, title
+        if not title or keyword_l not in title.lower():
+            continue
+        # 进一步确认该窗口是否真的“可见”（在应用栏显示）
+        if getattr(window, "visible", False):
+            return True, title
     return False, None
 
+def _make_state_printer(target_keyword):
+    """返回一个检查函数：每次调用重新判断一次，只在状态变化时打印"""
+    state = {"open": False}
+
+    def check():
+        is_open, actual_title = is_app_running_as_window(target_keyword)
+
+        if is_open:
+            if not state["open"]:
+                print(f"\n[!] 检测到应用开启!")
+                print(f"状态: {target_keyword} is OPEN")
+                print(f"具体窗口标题为: {actual_title}")
+                state["open"] = True
+        else:
+            if state["open"]:
+                print(f"\n[?] 应用已从'应用'栏消失 (已关闭或完全隐藏至后台)")
+                state["open"] = False
+
+    return check
+
+
+def _watch_with_win_events(check):
+    """
+    事件驱动：只在前台切换 / 窗口显示、隐藏、销毁 / 标题变化时重新检查，桌面空闲时不占 CPU
+    """
+    def _on_event(_hook, _event, _hwnd, id_object, id_child, _thread, _time):
+        # 只关心顶层窗口本身的事件，忽略控件级别的
+        if id_object == OBJID_WINDOW and id_child == 0:
+            check()
+
+    proc = _WinEventProc(_on_event)  # 必须保持引用，否则回调会被回收
+    flags = WINEVENT_OUTOFCONTEXT | WINEVENT_SKIPOWNPROCESS
+    hooks = [
+        _user32.SetWinEventHook(lo, hi, None, proc, 0, 0, flags)
+        for lo, hi in (
+            (EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND),
+            (EVENT_OBJECT_DESTROY, EVENT_OBJECT_HIDE),
+            (EVENT_OBJECT_NAMECHANGE, EVENT_OBJECT_NAMECHANGE),
+        )
+    ]
+
+    # GetMessageW 阻塞时收不到 KeyboardInterrupt：Ctrl+C 时给本线程投递 WM_QUIT
+    main_tid = _kernel32.GetCurrentThreadId()
+
+    def _on_ctrl(_ctrl_type):
+        _user32.PostThreadMessageW(main_tid, WM_QUIT, 0, 0)
+        return True
+
+    ctrl_handler = _CtrlHandler(_on_ctrl)
+    _kernel32.SetConsoleCtrlHandler(ctrl_handler, True)
+
+    check()
+    msg = wintypes.MSG()
+    try:
+        while _user32.GetMessageW(ctypes.byref(msg), None, 0, 0) > 0:
+            _user32.TranslateMessage(ctypes.byref(msg))
+            _user32.DispatchMessageW(ctypes.byref(msg))
+    finally:
+        for h in hooks:
+            if h:
+                _user32.UnhookWinEvent(h)
+        _kernel32.SetConsoleCtrlHandler(ctrl_handler, False)
+
+
 def main():
     # 根据你的描述，微信的显示名称是“微信”
     target_keyword = "微信"
     
     print(f"--- 正在监控 Windows '应用' 栏，寻找窗口标题包含: {target_keyword} ---")
     
-    already_open = False
+    check = _make_state_printer(target_keyword)
+
+    if sys.platform == "win32":
+        _watch_with_win_events(check)
+        print("\n监控已停止。")
+        return
 
     try:
         while True:
-            is_open, actual_title = is_app_running_as_window(target_keyword)
-            
-            if is_open:
-                if not already_open:
-                    print(f"\n[!] 检测到应用开启!")
-                    print(f"状态: {target_keyword} is OPEN")
-                    print(f"具体窗口标题为: {actual_title}")
-                    already_open = True
-            else:
-                if already_open:
-                    print(f"\n[?] 应用已从'应用'栏消失 (已关闭或完全隐藏至后台)")
-                    already_open = False
+            check()
             
             # 打印一个点表示心跳，证明脚本在跑
             print(".", end="", flush=True)
@@ -49,4 +158,4 @@ def main():
         print("\n监控已停止。")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
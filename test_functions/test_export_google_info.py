@@ -25,6 +25,30 @@ def get_credentials():
             token.write(creds.to_json())
     return creds
 
+# Google 批量请求单次最多 100 个调用
+_BATCH_LIMIT = 100
+
+
+def _fetch_tasks_per_list(task_service, task_lists):
+    """所有任务列表的 tasks().list 打包成批量请求发出，而不是每个列表一次往返"""
+    results = [[] for _ in task_lists]
+    errors = []
+
+    def _on_tasks(request_id, response, exception):
+        if exception is not None:
+            errors.append(exception)
+            return
+        results[int(request_id)] = (response or {}).get('items', [])
+
+    for lo in range(0, len(task_lists), _BATCH_LIMIT):
+        batch = task_service.new_batch_http_request(callback=_on_tasks)
+        for i in range(lo, min(lo + _BATCH_LIMIT, len(task_lists))):
+            batch.add(task_service.tasks().list(tasklist=task_lists[i]['id']), request_id=str(i))
+        batch.execute()
+        if errors:
+            raise errors[0]
+    return results
+
 def fetch_today_data():
     creds = get_credentials()
     cal_service = build('calendar', 'v3', credentials=creds)
@@ -70,8 +94,7 @@ def fetch_today_data():
 
     # 2. 抓取今日任务
     task_lists = task_service.tasklists().list().execute().get('items', [])
-    for t_list in task_lists:
-        tasks = task_service.tasks().list(tasklist=t_list['id']).execute().get('items', [])
+    for t_list, tasks in zip(task_lists, _fetch_tasks_per_list(task_service, task_lists)):
         # 仅保留截止日期为今天的
         for task in tasks:
             due_date = task.get('due')
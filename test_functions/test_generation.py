@@ -1,12 +1,20 @@
 import os
 import json
 import re
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
 
 from google import genai
 from google.genai import types
 
+try:
+    import orjson  # 可选：更快的 JSON 读写
+except ImportError:
+    orjson = None
+
 
 # =======================
 # Global Configuration
@@ -27,6 +35,9 @@ TIMEZONE_NAME = "America/Los_Angeles"
 TEXT_MODEL = "gemini-3-flash-preview"
 # - 图像生成：Gemini 3 Pro Image（preview）
 IMAGE_MODEL = "gemini-3-pro-image-preview"
+# - 预览图：Flash Image 出图快，先写一版给 UI 展示，Pro 图完成后再替换
+PREVIEW_IMAGE_MODEL = "gemini-2.5-flash-image"
+ENABLE_PREVIEW_IMAGE = True
 
 # 5) 你要的“风格选择”（你只需要改这个变量）
 # 可选： "year_in_review_cute", "abstract", "watercolor", "pixel_art", "isometric", "minimalist", "cyberpunk"
@@ -42,6 +53,14 @@ AVOID_SENSITIVE_TEXT = True
 # 你后续做网页展示，1024 或 1536 通常足够
 TARGET_IMAGE_HINT = "1024x1024"
 
+# 9) 生成缓存：模型 + 提示词完全相同时直接复用上次的结果（存放在输出目录下），跳过 Gemini 调用
+USE_GENERATION_CACHE = True
+CACHE_DIRNAME = ".image_cache"
+
+# 10) 单次 Gemini 请求超时（秒）：文本和图片并发请求，避免一个卡住拖住另一个
+TEXT_TIMEOUT_SECONDS = 120
+IMAGE_TIMEOUT_SECONDS = 300
+
 
 # =======================
 # Utilities
@@ -60,8 +79,9 @@ def _today_folder(now: datetime) -> str:
 
 
 def _find_today_timeline_json() -> str:
-    day_dir = _today_folder(datetime.now())
-    fname = f"timeline_{datetime.now().strftime('%Y-%m-%d')}.json"
+    now = datetime.now()
+    day_dir = _today_folder(now)
+    fname = f"timeline_{now.strftime('%Y-%m-%d')}.json"
     path = os.path.join(day_dir, fname)
     if not os.path.isfile(path):
         raise RuntimeError(f"Cannot find today's timeline JSON at: {path}")
@@ -69,22 +89,38 @@ def _find_today_timeline_json() -> str:
 
 
 def _load_json(path: str) -> Dict[str, Any]:
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
 def _write_json(path: str, obj: Dict[str, Any]) -> None:
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        return
     with open(path, "w", encoding="utf-8") as f:
         json.dump(obj, f, ensure_ascii=False, indent=2)
 
 
+# 长串数字 / 邮箱合成一个正则，一次扫描完成替换
+_REDACT_RE = re.compile(
+    r"(?P<num>\b\d{6,}\b)"
+    r"|(?P<mail>[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,})"
+)
+
+
+def _redact_repl(m: "re.Match[str]") -> str:
+    return "[REDACTED_NUMBER]" if m.lastgroup == "num" else "[REDACTED_EMAIL]"
+
+
 def _sanitize_text(s: str) -> str:
     # 简单防御：去掉可能的“长串数字/邮箱”等（避免无意间把敏感信息写进报告）
     if not s:
         return s
-    s = re.sub(r"\b\d{6,}\b", "[REDACTED_NUMBER]", s)
-    s = re.sub(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}", "[REDACTED_EMAIL]", s)
-    return s
+    return _REDACT_RE.sub(_redact_repl, s)
 
 
 def _timeline_to_compact_text(timeline: Dict[str, Any], max_lines: int = 120) -> str:
@@ -99,24 +135,18 @@ def _timeline_to_compact_text(timeline: Dict[str, Any], max_lines: int = 120) ->
     hr = timeline.get("timeline_human_readable", [])
     if isinstance(hr, list) and hr:
         lines.append("Timeline (human readable):")
-        for x in hr[:max_lines]:
-            if isinstance(x, str):
-                lines.append(f"- {x}")
+        lines.extend(f"- {x}" for x in hr[:max_lines] if isinstance(x, str))
 
     segs = timeline.get("timeline_segments", [])
     if isinstance(segs, list) and segs:
         lines.append("Segments (structured):")
-        for seg in segs[: min(len(segs), 80)]:
-            try:
-                st = seg.get("start_time_local", "")
-                et = seg.get("end_time_local", "")
-                dom = seg.get("dominant_surface", "")
-                act = seg.get("activity", "")
-                dur = seg.get("duration_minutes", "")
-                conf = seg.get("confidence", "")
-                lines.append(f"- {st}-{et} | {dom} | {act} | {dur}min | conf={conf}")
-            except Exception:
-                continue
+        # 非 dict 的段直接跳过（原来靠 try/except 兜底）
+        lines.extend(
+            f"- {seg.get('start_time_local', '')}-{seg.get('end_time_local', '')}"
+            f" | {seg.get('dominant_surface', '')} | {seg.get('activity', '')}"
+            f" | {seg.get('duration_minutes', '')}min | conf={seg.get('confidence', '')}"
+            for seg in segs[:80] if isinstance(seg, dict)
+        )
 
     txt = "\n".join(lines)
     return _sanitize_text(txt) if AVOID_SENSITIVE_TEXT else txt
@@ -126,65 +156,67 @@ def _timeline_to_compact_text(timeline: Dict[str, Any], max_lines: int = 120) ->
 # Prompt templates
 # =======================
 
+# 风格预设：文本固定不变，模块加载时构建一次
+_STYLE_PRESETS: Dict[str, Dict[str, str]] = {
+    "year_in_review_cute": {
+        "name": "Cute Year-in-Review",
+        "prompt": (
+            "Create a cute, warm 'year-in-review / daily recap' illustration. "
+            "Chibi-style characters, soft shading, clean shapes, gentle glow, "
+            "sticker-like elements, and a cohesive pastel palette. "
+            "Add small iconic objects representing the day's activities."
+        )
+    },
+    "abstract": {
+        "name": "Abstract",
+        "prompt": (
+            "Create an abstract art piece that conveys the day's rhythm and mood. "
+            "Use geometric shapes, expressive brush strokes, and symbolic motifs rather than literal UI screens."
+        )
+    },
+    "watercolor": {
+        "name": "Watercolor",
+        "prompt": (
+            "Create a watercolor illustration with visible paper texture, soft bleeding edges, and light washes. "
+            "Focus on atmosphere and storytelling."
+        )
+    },
+    "pixel_art": {
+        "name": "Pixel Art",
+        "prompt": (
+            "Create a pixel art scene (16-bit style), crisp tiles and readable silhouettes. "
+            "Depict the day's major activities as objects or mini-scenes."
+        )
+    },
+    "isometric": {
+        "name": "Isometric",
+        "prompt": (
+            "Create an isometric diorama of a desk/workspace and surrounding mini-scenes. "
+            "Clean lines, subtle shadows, high readability."
+        )
+    },
+    "minimalist": {
+        "name": "Minimalist",
+        "prompt": (
+            "Create a minimalist poster-like illustration using few shapes and strong composition. "
+            "Avoid clutter; use icons to represent activities."
+        )
+    },
+    "cyberpunk": {
+        "name": "Cyberpunk",
+        "prompt": (
+            "Create a cyberpunk illustration with neon lighting, high contrast, and futuristic UI motifs. "
+            "Still keep it tasteful and not overly dark."
+        )
+    },
+}
+
+
 def _style_prompt(style_preset: str) -> Dict[str, str]:
     """
     你要的风格 options：统一映射到图像生成 prompt 的“画风段落”
     """
-    presets = {
-        "year_in_review_cute": {
-            "name": "Cute Year-in-Review",
-            "prompt": (
-                "Create a cute, warm 'year-in-review / daily recap' illustration. "
-                "Chibi-style characters, soft shading, clean shapes, gentle glow, "
-                "sticker-like elements, and a cohesive pastel palette. "
-                "Add small iconic objects representing the day's activities."
-            )
-        },
-        "abstract": {
-            "name": "Abstract",
-            "prompt": (
-                "Create an abstract art piece that conveys the day's rhythm and mood. "
-                "Use geometric shapes, expressive brush strokes, and symbolic motifs rather than literal UI screens."
-            )
-        },
-        "watercolor": {
-            "name": "Watercolor",
-            "prompt": (
-                "Create a watercolor illustration with visible paper texture, soft bleeding edges, and light washes. "
-                "Focus on atmosphere and storytelling."
-            )
-        },
-        "pixel_art": {
-            "name": "Pixel Art",
-            "prompt": (
-                "Create a pixel art scene (16-bit style), crisp tiles and readable silhouettes. "
-                "Depict the day's major activities as objects or mini-scenes."
-            )
-        },
-        "isometric": {
-            "name": "Isometric",
-            "prompt": (
-                "Create an isometric diorama of a desk/workspace and surrounding mini-scenes. "
-                "Clean lines, subtle shadows, high readability."
-            )
-        },
-        "minimalist": {
-            "name": "Minimalist",
-            "prompt": (
-                "Create a minimalist poster-like illustration using few shapes and strong composition. "
-                "Avoid clutter; use icons to represent activities."
-            )
-        },
-        "cyberpunk": {
-            "name": "Cyberpunk",
-            "prompt": (
-                "Create a cyberpunk illustration with neon lighting, high contrast, and futuristic UI motifs. "
-                "Still keep it tasteful and not overly dark."
-            )
-        },
-    }
-
-    return presets.get(style_preset, presets["year_in_review_cute"])
+    return _STYLE_PRESETS.get(style_preset, _STYLE_PRESETS["year_in_review_cute"])
 
 
 def _vibe_analysis_prompt(timeline_text: str) -> str:
@@ -263,6 +295,7 @@ def _call_gemini_text_json(client: genai.Client, prompt: str) -> Dict[str, Any]:
         config=types.GenerateContentConfig(
             temperature=0.2,
             thinking_config=types.ThinkingConfig(thinking_level="medium"),
+            http_options=types.HttpOptions(timeout=TEXT_TIMEOUT_SECONDS * 1000),
         ),
     )
     text = (resp.text or "").strip()
@@ -303,17 +336,18 @@ def _extract_image_bytes_from_response(resp: Any) -> Optional[Tuple[bytes, str]]
     return None
 
 
-def _call_gemini_generate_image(client: genai.Client, prompt: str) -> Tuple[bytes, str]:
+def _call_gemini_generate_image(client: genai.Client, prompt: str, model: str = IMAGE_MODEL) -> Tuple[bytes, str]:
     """
     使用支持图片输出的模型生成图片。
     注意：部分 image 模型不支持 thinking_config，不能传 thinking_level。
     """
     resp = client.models.generate_content(
-        model=IMAGE_MODEL,
+        model=model,
         contents=prompt,
         config=types.GenerateContentConfig(
-            temperature=0.7
+            temperature=0.7,
             # 不要传 thinking_config：该模型可能不支持
+            http_options=types.HttpOptions(timeout=IMAGE_TIMEOUT_SECONDS * 1000),
         ),
     )
 
@@ -328,6 +362,94 @@ def _call_gemini_generate_image(client: genai.Client, prompt: str) -> Tuple[byte
     return extracted[0], extracted[1]
 
 
+# =======================
+# Generation cache
+# =======================
+
+def _cache_key(*parts: str) -> str:
+    return hashlib.blake2b("|".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _image_ext(mime: str) -> str:
+    return ".png" if "png" in (mime or "").lower() else ".jpg"
+
+
+def _cached_text_json(client: genai.Client, prompt: str, cache_dir: str) -> Dict[str, Any]:
+    if not cache_dir:
+        return _call_gemini_text_json(client, prompt)
+    path = os.path.join(cache_dir, _cache_key(TEXT_MODEL, prompt) + ".json")
+    if os.path.isfile(path):
+        return _load_json(path)
+    obj = _call_gemini_text_json(client, prompt)
+    _write_json(path, obj)
+    return obj
+
+
+def _cached_image_file(cache_dir: str, prompt: str) -> Optional[Tuple[str, str]]:
+    if not cache_dir:
+        return None
+    key = _cache_key(IMAGE_MODEL, STYLE_PRESET, prompt)
+    for ext, mime in ((".png", "image/png"), (".jpg", "image/jpeg")):
+        path = os.path.join(cache_dir, key + ext)
+        if os.path.isfile(path):
+            return path, mime
+    return None
+
+
+def _generate_image_file(client: genai.Client, prompt: str, cache_dir: str, out_base: str,
+                         model: str = IMAGE_MODEL) -> Tuple[str, str]:
+    """
+    生成图片并直接写到 out_base + 扩展名，返回 (路径, mime)。
+    图片字节只在这里短暂存在，写盘后立即释放；缓存命中时直接复制缓存文件。
+    """
+    use_cache = bool(cache_dir) and model == IMAGE_MODEL
+    hit = _cached_image_file(cache_dir, prompt) if use_cache else None
+    if hit:
+        path = out_base + _image_ext(hit[1])
+        shutil.copyfile(hit[0], path)
+        return path, hit[1]
+
+    img_bytes, img_mime = _call_gemini_generate_image(client, prompt, model)
+    path = out_base + _image_ext(img_mime)
+    with open(path, "wb") as f:
+        f.write(img_bytes)
+    del img_bytes
+
+    if use_cache:
+        key = _cache_key(IMAGE_MODEL, STYLE_PRESET, prompt)
+        shutil.copyfile(path, os.path.join(cache_dir, key + _image_ext(img_mime)))
+    return path, img_mime
+
+
+# =======================
+# Report scrubbing
+# =======================
+
+# 只有这些字段下面的内容来自模型 / 时间线文本，需要脱敏；
+# 其余字段（版本号、时区、风格名、文件路径等）都是脚本自己生成的
+_SCRUB_KEYS = frozenset({"vibe", "prompt_used"})
+
+
+def _scrub_all(x: Any) -> Any:
+    if isinstance(x, str):
+        return _sanitize_text(x)
+    if isinstance(x, list):
+        return [_scrub_all(i) for i in x]
+    if isinstance(x, dict):
+        return {k: _scrub_all(v) for k, v in x.items()}
+    return x
+
+
+def _scrub_report(x: Any, key: Optional[str] = None) -> Any:
+    if key in _SCRUB_KEYS:
+        return _scrub_all(x)
+    if isinstance(x, list):
+        return [_scrub_report(i) for i in x]
+    if isinstance(x, dict):
+        return {k: _scrub_report(v, k) for k, v in x.items()}
+    return x
+
+
 # =======================
 # Main generation pipeline
 # =======================
@@ -345,65 +467,81 @@ def generate_daily_story() -> Dict[str, Any]:
 
     client = genai.Client(api_key=GEMINI_API_KEY)
 
+    cache_dir = os.path.join(out_dir, CACHE_DIRNAME) if USE_GENERATION_CACHE else ""
+    _ensure_dir(cache_dir)
+
     # 1) Vibe + caring
     vibe_prompt = _vibe_analysis_prompt(timeline_text)
-    vibe = _call_gemini_text_json(client, vibe_prompt)
 
     # 2) Redraw image
     style = _style_prompt(STYLE_PRESET)
     style_block = style["prompt"]
     image_prompt = _redraw_image_prompt(timeline_text, style_block)
 
-    img_bytes, img_mime = _call_gemini_generate_image(client, image_prompt)
-
-    # 输出图片
     date_local = timeline.get("date_local", datetime.now().strftime("%Y-%m-%d"))
-    img_ext = ".png" if "png" in (img_mime or "").lower() else ".jpg"
-    img_name = f"redraw_{date_local}_{STYLE_PRESET}{img_ext}"
-    img_path = os.path.join(out_dir, img_name)
-
-    with open(img_path, "wb") as f:
-        f.write(img_bytes)
+    report_path = os.path.join(out_dir, f"daily_report_{date_local}.json")
 
-    # 3) 汇总为 daily report JSON（供 UI 直接读取）
-    report = {
-        "schema_version": "1.0",
-        "date_local": date_local,
-        "timezone": TIMEZONE_NAME,
-        "inputs": {
-            "timeline_json": os.path.abspath(timeline_path),
-            "style_preset": STYLE_PRESET,
-            "style_name": style["name"],
-        },
-        "outputs": {
-            "vibe": vibe,
-            "image": {
-                "file": img_path.replace("\\", "/"),
-                "mime_type": img_mime,
-                "prompt_used": image_prompt,
+    def emit_report(version: int, vibe: Optional[Dict[str, Any]], image: Optional[Dict[str, Any]],
+                    preview: Optional[Dict[str, Any]]) -> None:
+        # 3) 汇总为 daily report JSON（供 UI 直接读取）；version 递增，UI 轮询它来替换预览图
+        report = {
+            "schema_version": "1.0",
+            "version": version,
+            "status": "final" if image is not None else "partial",
+            "date_local": date_local,
+            "timezone": TIMEZONE_NAME,
+            "inputs": {
+                "timeline_json": os.path.abspath(timeline_path),
+                "style_preset": STYLE_PRESET,
+                "style_name": style["name"],
+            },
+            "outputs": {
+                "vibe": vibe,
+                "image": image,
+                "preview_image": preview,
+            },
+            "ui_modules": {
+                "main_timeline_module": "Render timeline_human_readable + segments",
+                "secondary_image_module": "Show redraw image + short caption",
+                "secondary_caring_module": "Show caring_message + quote + humor_alt"
             }
-        },
-        "ui_modules": {
-            "main_timeline_module": "Render timeline_human_readable + segments",
-            "secondary_image_module": "Show redraw image + short caption",
-            "secondary_caring_module": "Show caring_message + quote + humor_alt"
         }
-    }
-
-    if AVOID_SENSITIVE_TEXT:
-        # 再保险：把 report 中的文本都做一次轻量脱敏
-        def scrub_obj(x: Any) -> Any:
-            if isinstance(x, str):
-                return _sanitize_text(x)
-            if isinstance(x, list):
-                return [scrub_obj(i) for i in x]
-            if isinstance(x, dict):
-                return {k: scrub_obj(v) for k, v in x.items()}
-            return x
-        report = scrub_obj(report)
 
-    report_path = os.path.join(out_dir, f"daily_report_{date_local}.json")
-    _write_json(report_path, report)
+        if AVOID_SENSITIVE_TEXT:
+            # 再保险：把 report 中可能带内容的文本做一次轻量脱敏
+            report = _scrub_report(report)
+
+        _write_json(report_path, report)
+
+    # 请求互不依赖，并发发出：总耗时 ≈ 较慢的那个；Flash 预览图先到先写
+    # 图片在各自的 worker 里直接写盘，主线程只拿到 (路径, mime)
+    img_base = os.path.join(out_dir, f"redraw_{date_local}_{STYLE_PRESET}")
+    preview = None
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        fut_vibe = ex.submit(_cached_text_json, client, vibe_prompt, cache_dir)
+        fut_img = ex.submit(_generate_image_file, client, image_prompt, cache_dir, img_base)
+        # Pro 图已在缓存里时不需要预览
+        if ENABLE_PREVIEW_IMAGE and not _cached_image_file(cache_dir, image_prompt):
+            fut_preview = ex.submit(_generate_image_file, client, image_prompt, "",
+                                    img_base + "_preview", PREVIEW_IMAGE_MODEL)
+            try:
+                pv_path, pv_mime = fut_preview.result()
+                preview = {"file": pv_path.replace("\\", "/"), "mime_type": pv_mime, "model": PREVIEW_IMAGE_MODEL}
+            except Exception as e:
+                print(f"[WARN] preview image failed: {e}")
+            if preview is not None and not fut_img.done():
+                vibe_ready = fut_vibe.done() and fut_vibe.exception() is None
+                emit_report(1, fut_vibe.result() if vibe_ready else None, None, preview)
+
+        vibe = fut_vibe.result()
+        img_path, img_mime = fut_img.result()
+
+    image = {
+        "file": img_path.replace("\\", "/"),
+        "mime_type": img_mime,
+        "prompt_used": image_prompt,
+    }
+    emit_report(2, vibe, image, preview)
 
     return {
         "timeline_json": timeline_path,
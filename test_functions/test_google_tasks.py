@@ -5,6 +5,9 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 
+# 批量取任务的实现和 test_export_google_info 共用一份
+from test_export_google_info import _fetch_tasks_per_list
+
 SCOPES = ['https://www.googleapis.com/auth/tasks.readonly']
 
 def get_tasks_service():
@@ -31,10 +34,7 @@ def main():
     print(f"正在检查今日 ({today_str}) 的待办任务...")
     found_any = False
 
-    for item in items:
-        tasks_result = service.tasks().list(tasklist=item['id']).execute()
-        tasks = tasks_result.get('items', [])
-        
+    for item, tasks in zip(items, _fetch_tasks_per_list(service, items)):
         # 过滤出截止日期是今天的任务
         # 注意：Google Tasks 的 due 字段通常是 "YYYY-MM-DDT00:00:00.000Z"
         today_tasks = [t for t in tasks if t.get('due') and t['due'].startswith(today_str)]
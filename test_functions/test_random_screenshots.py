@@ -1,8 +1,12 @@
 import os
+import sys
+import json
 import shutil
 import random
+import ctypes
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Set
 
 # =======================
 # Global Configuration
@@ -33,6 +37,15 @@ AVOID_FILENAME_COLLISION = True
 # 支持的图片后缀
 IMAGE_EXTS = {".png", ".jpg", ".jpeg"}
 
+# 并发复制的线程数（复制是 I/O 密集，线程即可）
+COPY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# 复制时直接做 test_timeline 的预处理（解码 → 缩放 → 编码）再写入输出目录，
+# 省掉一次“先原样复制、再读回来预处理”。会在输出目录写一个标记文件，
+# test_timeline 看到它就按同样的参数直接使用这些图片，不再重复编码
+FUSE_COPY_AND_PREPROCESS = False
+PREPROCESSED_MARKER = ".preprocessed.json"
+
 
 def _ensure_dir(path: str) -> None:
     if not os.path.exists(path):
@@ -53,11 +66,15 @@ def _list_images_recursive(root: str) -> List[str]:
     if not os.path.isdir(root):
         return paths
 
-    for dirpath, _, filenames in os.walk(root):
-        for fn in filenames:
-            ext = os.path.splitext(fn)[1].lower()
-            if ext in IMAGE_EXTS:
-                paths.append(os.path.join(dirpath, fn))
+    # 用栈 + scandir 遍历：DirEntry 自带文件类型，不用再对每个条目 stat
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTS:
+                    paths.append(entry.path)
     return paths
 
 
@@ -89,38 +106,88 @@ def _compute_schedule(d: date, n: int) -> List[datetime]:
         return [start_dt]
 
     total_seconds = int((end_dt - start_dt).total_seconds())
-    # n 个点均匀铺开到区间内（最后一个点不强制等于 end_dt）
-    step = total_seconds / float(n - 1)
-
-    times: List[datetime] = []
-    for i in range(n):
-        t = start_dt + timedelta(seconds=int(round(step * i)))
-        # 保证不会超过 end_dt（极端四舍五入）
-        if t > end_dt:
-            t = end_dt
-        times.append(t)
-
-    return times
+    # n 个点均匀铺开到区间内：整数运算四舍五入 total*i/(n-1)，
+    # 不经过浮点，最大偏移正好是 total_seconds，不会超过 end_dt
+    denom = 2 * (n - 1)
+    return [
+        start_dt + timedelta(seconds=(2 * total_seconds * i + n - 1) // denom)
+        for i in range(n)
+    ]
+
+
+# Linux reflink ioctl：在 Btrfs/XFS 等文件系统上只复制元数据，不复制数据
+FICLONE = 0x40049409
+
+
+def _copy_linux(src: str, dst: str) -> None:
+    import fcntl
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return
+        except OSError:
+            pass
+
+        # 不支持 reflink：copy_file_range 在内核里复制，不经过用户态缓冲
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        try:
+            while copied < size:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                if n == 0:
+                    break
+                copied += n
+        except OSError:
+            pass
+        if copied >= size:
+            return
+
+        # 兜底：普通的读写复制
+        fsrc.seek(0)
+        fdst.seek(0)
+        fdst.truncate()
+        shutil.copyfileobj(fsrc, fdst)
+
+
+def _fast_copy(src: str, dst: str) -> None:
+    """按平台选最快的复制方式，失败则退回 shutil.copyfile"""
+    if sys.platform == "win32":
+        # CopyFile2 返回 HRESULT，0 表示成功
+        if ctypes.windll.kernel32.CopyFile2(ctypes.c_wchar_p(src), ctypes.c_wchar_p(dst), None) == 0:
+            return
+    elif sys.platform.startswith("linux"):
+        _copy_linux(src, dst)
+        return
+    shutil.copyfile(src, dst)
 
 
 def _safe_copy(src: str, dst: str) -> None:
     _ensure_dir(os.path.dirname(dst))
-    shutil.copy2(src, dst)
+    _fast_copy(src, dst)
+    shutil.copystat(src, dst)  # 和 copy2 一样保留时间戳
 
 
-def _unique_destination_path(dest_dir: str, base_dt: datetime, ext: str) -> str:
+def _unique_destination_path(
+    dest_dir: str,
+    base_dt: datetime,
+    ext: str,
+    used: Set[str],
+    rng: random.Random
+) -> str:
     """
     生成不冲突的目标路径。若发生同名，则在秒级递增直到不冲突（或直接覆盖由你控制）。
+    used：目录里已有的文件名 + 本次已分配的文件名（内存查表，不逐个 stat）
     """
     dt_try = base_dt
     for _ in range(200):  # 200 秒足够避免冲突
         name = _format_filename(dt_try, ext)
         path = os.path.join(dest_dir, name)
-        if not AVOID_FILENAME_COLLISION or not os.path.exists(path):
+        if not AVOID_FILENAME_COLLISION or name not in used:
+            used.add(name)
             return path
         dt_try = dt_try + timedelta(seconds=1)
     # 最后兜底：加随机后缀
-    name = dt_try.strftime("%H-%M-%S") + f"_{random.randint(1000,9999)}" + ext.lower()
+    name = dt_try.strftime("%H-%M-%S") + f"_{rng.randint(1000,9999)}" + ext.lower()
     return os.path.join(dest_dir, name)
 
 
@@ -133,13 +200,12 @@ def generate_randomized_test_day() -> str:
     if not source_images:
         raise RuntimeError(f"No images found under: {SOURCE_SCREENSHOT_ROOT}")
 
-    # 随机
-    if RANDOM_SEED is not None:
-        random.seed(RANDOM_SEED)
+    # 随机：用独立的 Random 实例，不改动全局 random 的状态（种子相同则结果和以前一致）
+    rng = random.Random(RANDOM_SEED)
 
     images = list(source_images)
     if RANDOM_SHUFFLE:
-        random.shuffle(images)
+        rng.shuffle(images)
 
     # 分配时间点
     schedule = _compute_schedule(d, len(images))
@@ -148,7 +214,44 @@ def generate_randomized_test_day() -> str:
     out_dir = _day_folder(OUTPUT_SCREENSHOT_ROOT, d)
     _ensure_dir(out_dir)
 
-    # 复制并重命名
+    # 旧标记只对它记录的那些文件有效：非融合模式这次会复制原图进来，先删掉；
+    # 融合模式且参数相同则沿用旧文件列表，参数不同同样作废
+    marker_path = os.path.join(out_dir, PREPROCESSED_MARKER)
+    old_marker: Optional[dict] = None
+    try:
+        with open(marker_path, "r", encoding="utf-8") as f:
+            old_marker = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if old_marker is not None:
+        os.remove(marker_path)
+
+    copy_one = _safe_copy
+    out_ext: Optional[str] = None
+    marker: Optional[dict] = None
+    if FUSE_COPY_AND_PREPROCESS and images:
+        # 同目录的脚本；只有融合模式才需要（会带上 PIL / genai 依赖）
+        import test_timeline as tl
+
+        # 和 test_timeline 一样：用当天第一张图（排在最早的时间点）推断屏幕大小
+        screen_w, screen_h = tl._read_image_size(images[0])
+        target_long_edge = tl._compute_target_long_edge(screen_w, screen_h)
+        fmt = tl.PREPROCESS_FORMAT.lower()
+        out_ext = ".jpg" if fmt == "jpeg" else ".png"
+        marker = {
+            "screen_resolution": f"{screen_w}x{screen_h}",
+            "target_long_edge": target_long_edge,
+            "format": fmt,
+        }
+
+        def copy_one(src: str, dst: str) -> None:
+            data, _, _ = tl._preprocess_image_bytes(src, target_long_edge, fmt, tl.JPEG_QUALITY)
+            with open(dst, "wb") as f:
+                f.write(data)
+
+    # 先按顺序分配好所有目标文件名（保证冲突处理结果确定），再并发复制
+    tasks: List[Tuple[str, str]] = []
+    used: Set[str] = set(os.listdir(out_dir)) if os.path.isdir(out_dir) else set()
     for src_path, dt_local in zip(images, schedule):
         _, ext = os.path.splitext(src_path)
         ext = ext.lower()
@@ -156,8 +259,20 @@ def generate_randomized_test_day() -> str:
             # 防御性：跳过非常规后缀
             continue
 
-        dst_path = _unique_destination_path(out_dir, dt_local, ext)
-        _safe_copy(src_path, dst_path)
+        tasks.append((src_path, _unique_destination_path(out_dir, dt_local, out_ext or ext, used, rng)))
+
+    # 复制并重命名
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as ex:
+        list(ex.map(lambda t: copy_one(*t), tasks))
+
+    if marker is not None:
+        # 只列出确实是预处理过的文件；目录里其它图（之前非融合模式复制的原图）不在其中
+        files = [os.path.basename(dst) for _, dst in tasks]
+        if isinstance(old_marker, dict) and all(old_marker.get(k) == v for k, v in marker.items()):
+            files = list(dict.fromkeys(list(old_marker.get("files") or []) + files))
+        marker["files"] = files
+        with open(marker_path, "w", encoding="utf-8") as f:
+            json.dump(marker, f, ensure_ascii=False, indent=2)
 
     return out_dir
 
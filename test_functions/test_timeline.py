@@ -1,13 +1,49 @@
 import os
+import re
 import json
 import time
-from dataclasses import dataclass
+import random
+import asyncio
+import hashlib
+import importlib.util
+import struct
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
 from datetime import datetime, date, timedelta
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator, Iterable, Deque, DefaultDict, Union, IO
 
 from PIL import Image
 from google import genai
-from google.genai import types
+from google.genai import errors, types
+
+try:
+    import pyvips  # 可选：libvips 缩放时在解码阶段就缩小（shrink-on-load），比 PIL 快很多
+except Exception:
+    pyvips = None
+
+try:
+    import mozjpeg_lossless_optimization  # 可选：mozjpeg 无损重排 JPEG（同样像素，体积小一截）
+except Exception:
+    mozjpeg_lossless_optimization = None
+
+try:
+    import orjson  # 可选：更快的 JSON 读写
+except ImportError:
+    orjson = None
+
+try:
+    import httpx  # genai SDK 的异步请求默认走 httpx；用来调连接池 / 开 HTTP/2
+except ImportError:
+    httpx = None
+
+try:
+    import aiohttp  # 装了的话 genai SDK 的异步请求改走 aiohttp
+except ImportError:
+    aiohttp = None
 
 
 # =======================
@@ -46,14 +82,56 @@ DOWNSCALE_RATIO = 0.55     # 大屏时默认缩放比例（0.5~0.7 推荐）
 MIN_LONG_EDGE = 900        # 避免小屏再压缩到看不清
 MAX_LONG_EDGE = 1600       # 控制大屏的最大长边，进一步省 token
 
+# 关闭预处理时，原图（常常 5~10 MB 的 PNG）也先轻量转成 JPEG 再上传：
+# 只缩到长边 RAW_DOWNCAST_LONG_EDGE，不做 dHash / 统计；转完反而更大就用原图
+RAW_DOWNCAST_JPEG = True
+RAW_DOWNCAST_LONG_EDGE = 1280
+RAW_DOWNCAST_QUALITY = 75
+
+# test_random_screenshots 融合模式写下的标记：目录里的图已按其中参数预处理过
+PREPROCESSED_MARKER = ".preprocessed.json"
+
+# 预处理 / 原图转 JPEG 并行：多进程绕过 GIL（0 表示用全部 CPU 核）；图片太少时直接串行，省掉进程启动开销
+PREPROCESS_WORKERS = 0
+PREPROCESS_PARALLEL_MIN_IMAGES = 4
+
+# 近重复帧去重：缩放后算 64 位 dHash，和之前真正送去 Gemini 的帧比较，
+# 汉明距离 <= 阈值就直接复用它的识别结果（省一次 API 调用）
+ENABLE_DEDUP = True
+DEDUP_HAMMING_THRESHOLD = 5
+# True：和当天所有已分析帧比（切回同一个页面也能复用）；False：只和上一张比
+DEDUP_ACROSS_DAY = True
+
 # 你可以做“token消耗测试”的参数：
 # - DRY_RUN=True：只预处理并输出统计，不调用 Gemini
 # - SAMPLE_LIMIT：只取前 N 张来试算（0 表示全部）
 DRY_RUN = False
 SAMPLE_LIMIT = 0
 
-# Gemini 请求节流（避免过快限流）
-REQUEST_SLEEP_SECONDS = 0.2
+# Gemini 临时错误（429 / 5xx / 网络）重试：指数退避 + ±25% 抖动；服务端给了 retry 时间就按它的来
+GEMINI_MAX_ATTEMPTS = 3
+GEMINI_BACKOFF_BASE_SECONDS = 1.0
+
+# 同时在飞的 Gemini 请求数（异步并发，受 API QPS 限制）
+GEMINI_CONCURRENCY = 8
+
+# 按配额节流（令牌桶，按分钟匀速回填）：每次请求前先预留 1 个请求 + 估算的 token 数；0 表示不限
+# 估算 token = 每张图固定 GEMINI_IMAGE_TOKEN_ESTIMATE + prompt 字符数 / 4 + 输出预留
+GEMINI_RPM_LIMIT = 150
+GEMINI_TPM_LIMIT = 1_000_000
+GEMINI_IMAGE_TOKEN_ESTIMATE = 1120
+GEMINI_OUTPUT_TOKEN_ESTIMATE = 200
+# 遇到 429 后这么多秒内并发减半（自适应）
+GEMINI_RATE_LIMIT_COOLDOWN_SECONDS = 60
+
+# 逐帧识别结果缓存（存在当天截图目录里）：key = sha256(模型 + prompt 模板 + mime + 图片 bytes)
+# 同一张图重跑 / 字节完全相同的截图都不再调 Gemini；换模型或改 prompt 自动失效
+USE_FRAME_CACHE = True
+FRAME_CACHE_FILENAME = "frame_cache.json"
+
+# 断点续跑：每帧识别成功就追加一行到这个 JSONL（并 fsync），进程中途挂掉后重跑会跳过这些帧；
+# 当天 timeline 写完后删除
+PARTIAL_FILENAME = "frames_partial.jsonl"
 
 # 置信度阈值（低于则标记 low_confidence）
 LOW_CONFIDENCE_THRESHOLD = 0.60
@@ -62,7 +140,7 @@ LOW_CONFIDENCE_THRESHOLD = 0.60
 MERGE_BY_ACTIVITY_TOO = True
 
 
-@dataclass
+@dataclass(slots=True)
 class FrameResult:
     dt: datetime
     filename: str
@@ -72,6 +150,24 @@ class FrameResult:
     confidence: float
     supporting_surfaces: List[str]
     notes: str
+    hhmm: str = field(init=False, repr=False)  # dt 的 "HH:MM"，合并 / 缺口检测直接复用
+    dt_epoch: int = field(init=False, repr=False)  # dt 的墙钟秒数（从 1970-01-01 起），缺口检测只做整数相减
+
+    def __post_init__(self) -> None:
+        # replace() 换 dt 时也会重新走这里
+        self.hhmm = _hhmm(self.dt)
+        # 按墙钟算（和直接做 datetime 相减一致），不经过本机时区：跨夏令时也不会多 / 少一小时
+        self.dt_epoch = (self.dt.toordinal() - _EPOCH_ORDINAL) * 86400 + self.dt.hour * 3600 + self.dt.minute * 60 + self.dt.second
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# 一个截图间隔（segment 结束时间 = 最后一帧 + 一个间隔）
+CAPTURE_TD = timedelta(minutes=CAPTURE_INTERVAL_MINUTES)
+
+
+def _hhmm(dt: datetime) -> str:
+    return f"{dt.hour:02d}:{dt.minute:02d}"
 
 
 def _ensure_dir(path: str) -> None:
@@ -79,6 +175,24 @@ def _ensure_dir(path: str) -> None:
         os.makedirs(path)
 
 
+def _load_json(path: str) -> Any:
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path: str, obj: Any, indent: bool = True) -> None:
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, option=option))
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2 if indent else None)
+
+
 def _today_folder(now: datetime) -> str:
     year = now.strftime("%Y")
     month = now.strftime("%B")  # January...
@@ -107,11 +221,9 @@ def _list_day_images(day_dir: str, day_date: date) -> List[Tuple[datetime, str]]
         return []
 
     items: List[Tuple[datetime, str]] = []
-    for name in os.listdir(day_dir):
-        lower = name.lower()
-        if not (lower.endswith(".png") or lower.endswith(".jpg") or lower.endswith(".jpeg")):
-            continue
-
+    with os.scandir(day_dir) as it:
+        names = [e.name for e in it if e.name.lower().endswith((".png", ".jpg", ".jpeg")) and e.is_file()]
+    for name in names:
         t = _parse_time_from_filename(name)
         if t is None:
             continue
@@ -132,9 +244,9 @@ def _mime_type_for_ext(ext: str) -> str:
     return "application/octet-stream"
 
 
-def _build_frame_prompt(dt_local: datetime, filename: str) -> str:
-    return f"""
-You are analyzing a user's desktop screenshot taken at local time {dt_local.strftime('%Y-%m-%d %H:%M:%S')} (file: {filename}).
+# prompt 里只有时间戳和文件名会变：其余部分模块加载时拼好，每帧只拼一个短头
+_PROMPT_PREFIX = "You are analyzing a user's desktop screenshot taken at local time "
+_PROMPT_SUFFIX = """
 Goal: identify what the user is doing, using DOMINANT on-screen surface (largest/most salient region). If the screenshot is a web page, prefer labeling the WEBSITE/PRODUCT (e.g., YouTube, Google Docs, Gmail, Canvas, GitHub, LeetCode, Notion) rather than "Chrome" or "Browser". Only use "Chrome/Browser" if you truly cannot infer the page/product.
 
 Rules:
@@ -146,26 +258,90 @@ Rules:
 - notes: optional short rationale.
 
 Output STRICT JSON only (no markdown, no extra keys), with keys exactly:
-{{
+{
   "dominant_surface": "...",
   "activity": "...",
   "context_detail": "...",
   "confidence": 0.0,
   "supporting_surfaces": ["..."],
   "notes": "..."
-}}
-""".strip()
+}"""
+
+
+# 缓存 key 里的 prompt 部分：只看模板（每帧的时间/文件名不影响识别内容）
+_PROMPT_HASH = hashlib.sha256((_PROMPT_PREFIX + _PROMPT_SUFFIX).encode("utf-8")).hexdigest()[:16]
+
+
+def _build_frame_prompt(dt_local: datetime, filename: str) -> str:
+    return f"{_PROMPT_PREFIX}{dt_local:%Y-%m-%d %H:%M:%S} (file: {filename})." + _PROMPT_SUFFIX
+
+
+# 每帧的生成参数都一样：建一次，所有请求共用
+_FRAME_CONFIG = types.GenerateContentConfig(
+    thinking_config=types.ThinkingConfig(thinking_level="low"),
+    temperature=0.0
+)
 
 
 # =======================
 # Preprocess (resize + compress)
 # =======================
 
+_PNG_SIG = b"\x89PNG\r\n\x1a\n"
+# 带宽高的 JPEG SOF 标记（C4/C8/CC 不是 SOF）
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _fast_image_header(path: str) -> Optional[Tuple[str, int, int]]:
+    """
+    只读文件头拿 (格式, 宽, 高)，不建 Image 对象、不解码。
+    只认 PNG / JPEG，其他情况返回 None，交给 PIL 兜底。
+    """
+    with open(path, "rb") as f:
+        head = f.read(26)
+        if head[:8] == _PNG_SIG and head[12:16] == b"IHDR":
+            w, h = struct.unpack(">II", head[16:24])
+            return "png", w, h
+        if head[:2] != b"\xff\xd8":
+            return None
+        f.seek(2)
+        while True:
+            b = f.read(1)
+            while b and b != b"\xff":
+                b = f.read(1)
+            while b == b"\xff":
+                b = f.read(1)
+            if not b:
+                return None
+            marker = b[0]
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                continue  # 这些标记没有长度字段
+            seg = f.read(2)
+            if len(seg) < 2:
+                return None
+            if marker in _JPEG_SOF:
+                sof = f.read(5)
+                if len(sof) < 5:
+                    return None
+                h, w = struct.unpack(">HH", sof[1:5])
+                return "jpeg", w, h
+            f.seek(struct.unpack(">H", seg)[0] - 2, os.SEEK_CUR)
+
+
+def _fast_image_size(path: str) -> Optional[Tuple[int, int]]:
+    hdr = _fast_image_header(path)
+    return (hdr[1], hdr[2]) if hdr else None
+
+
 def _read_image_size(path: str) -> Tuple[int, int]:
+    size = _fast_image_size(path)
+    if size is not None:
+        return size
     with Image.open(path) as im:
         return im.size  # (w, h)
 
 
+@lru_cache(maxsize=16)  # 一天通常只有一种屏幕尺寸
 def _compute_target_long_edge(screen_w: int, screen_h: int) -> int:
     """
     根据“屏幕大小近似”（用当天第一张截图尺寸）决定缩放目标。
@@ -185,6 +361,74 @@ def _compute_target_long_edge(screen_w: int, screen_h: int) -> int:
     return target
 
 
+def _dhash_from_pixels(px: bytes) -> int:
+    """9x8 灰度像素（行优先）-> 64 位 dHash：每行相邻像素比较，右边更亮记 1"""
+    h = 0
+    for row in range(0, 72, 9):
+        for col in range(row, row + 8):
+            h = (h << 1) | (px[col + 1] > px[col])
+    return h
+
+
+def _dhash(im: Image.Image) -> int:
+    return _dhash_from_pixels(im.convert("L").resize((9, 8), resample=Image.BILINEAR).tobytes())
+
+
+def _mozjpeg_optimize(data: bytes) -> bytes:
+    """装了 mozjpeg_lossless_optimization 就无损重排 JPEG（像素不变），否则原样返回"""
+    if mozjpeg_lossless_optimization is None:
+        return data
+    try:
+        return mozjpeg_lossless_optimization.optimize(data)
+    except Exception:
+        return data
+
+
+def _preprocess_image_bytes_vips(
+    src_path: str,
+    target_long_edge: int,
+    out_format: str,
+    jpeg_quality: int
+) -> Tuple[bytes, str, Dict[str, Any]]:
+    original_size_bytes = os.path.getsize(src_path)
+
+    src = pyvips.Image.new_from_file(src_path, access="sequential")  # 只读文件头
+    w, h = src.width, src.height
+
+    resized = max(w, h) > target_long_edge
+    im = src
+    if resized:
+        # 长边缩到 target_long_edge，直接从解码器拿缩小后的图
+        im = pyvips.Image.thumbnail(src_path, target_long_edge, height=target_long_edge, size="down")
+
+    if out_format.lower() == "jpeg":
+        if im.hasalpha():
+            im = im.extract_band(0, n=im.bands - 1)  # 和 PIL convert("RGB") 一样直接丢掉 alpha
+        data = _mozjpeg_optimize(im.write_to_buffer(".jpg", Q=jpeg_quality, optimize_coding=True, interlace=True))
+        mime = "image/jpeg"
+    else:
+        data = im.write_to_buffer(".png", compression=9)
+        mime = "image/png"
+
+    # sequential 模式下源图不能再读一遍，dHash 从编码后的小图算
+    small = pyvips.Image.thumbnail_buffer(data, 9, height=8, size="force").colourspace("b-w").extract_band(0)
+    if small.format == "ushort":
+        small = small >> 8  # 16 位 PNG：和 PIL 的 convert("L") 一样落到 0~255
+    small = small.cast("uchar")
+
+    stats = {
+        "src_bytes": original_size_bytes,
+        "out_bytes": len(data),
+        "src_resolution": f"{w}x{h}",
+        "out_resolution": f"{im.width}x{im.height}",
+        "resized": resized,
+        "target_long_edge": target_long_edge,
+        "format": out_format.lower(),
+        "dhash": _dhash_from_pixels(small.write_to_memory())
+    }
+    return data, mime, stats
+
+
 def _preprocess_image_bytes(
     src_path: str,
     target_long_edge: int,
@@ -194,6 +438,13 @@ def _preprocess_image_bytes(
     """
     返回：(bytes, mime_type, stats)
     """
+    hdr = _fast_image_header(src_path)
+    if hdr is not None and hdr[0] == out_format.lower() and max(hdr[1], hdr[2]) <= target_long_edge:
+        return _passthrough_image_bytes(src_path, *hdr, target_long_edge)
+
+    if pyvips is not None:
+        return _preprocess_image_bytes_vips(src_path, target_long_edge, out_format, jpeg_quality)
+
     original_size_bytes = os.path.getsize(src_path)
 
     with Image.open(src_path) as im:
@@ -225,6 +476,9 @@ def _preprocess_image_bytes(
             ext = ".png"
 
         data = buf.getvalue()
+        if out_format.lower() == "jpeg":
+            data = _mozjpeg_optimize(data)
+        dhash = _dhash(im)
 
     stats = {
         "src_bytes": original_size_bytes,
@@ -233,30 +487,177 @@ def _preprocess_image_bytes(
         "out_resolution": f"{im.size[0]}x{im.size[1]}",
         "resized": resized,
         "target_long_edge": target_long_edge,
-        "format": out_format.lower()
+        "format": out_format.lower(),
+        "dhash": dhash
     }
     return data, mime, stats
 
 
+def _passthrough_image_bytes(
+    src_path: str,
+    fmt: str,
+    w: int,
+    h: int,
+    target_long_edge: int
+) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    已经够小且格式一致：原样读出文件，跳过解码 + 重新编码。
+    只有去重需要 dHash 时才打开图片（JPEG 用 draft 在解码时就缩小）。
+    """
+    with open(src_path, "rb") as f:
+        data = f.read()
+
+    dhash = None
+    if ENABLE_DEDUP:
+        with Image.open(src_path) as im:
+            im.draft("L", (w // 8 or 1, h // 8 or 1))
+            dhash = _dhash(im)
+
+    stats = {
+        "src_bytes": len(data),
+        "out_bytes": len(data),
+        "src_resolution": f"{w}x{h}",
+        "out_resolution": f"{w}x{h}",
+        "resized": False,
+        "target_long_edge": target_long_edge,
+        "format": fmt,
+        "passthrough": True,
+        "dhash": dhash
+    }
+    return data, _mime_type_for_ext(".png" if fmt == "png" else ".jpg"), stats
+
+
+def _preprocess_one(args: Tuple[str, int, str, int]) -> Tuple[bytes, str, Dict[str, Any]]:
+    # 供进程池 map 使用（需要是顶层函数才能 pickle）
+    return _preprocess_image_bytes(*args)
+
+
+def _match_anchor(h: int, anchors: List[Tuple[int, str]], exact: Dict[int, str]) -> Optional[str]:
+    """
+    在已分析帧 (dhash, filename) 里找近重复，返回被复用的文件名。
+    先查完全相同的 hash，再从最近的往前扫（越近越可能是同一画面）。
+    """
+    hit = exact.get(h)
+    if hit is not None:
+        return hit
+    scan = anchors if DEDUP_ACROSS_DAY else anchors[-1:]
+    for ah, fn in reversed(scan):
+        if (h ^ ah).bit_count() <= DEDUP_HAMMING_THRESHOLD:
+            return fn
+    return None
+
+
+def _read_raw_bytes(src_path: str) -> Tuple[bytes, str]:
+    with open(src_path, "rb") as f:
+        return f.read(), _mime_type_for_ext(os.path.splitext(src_path)[1])
+
+
+def _downcast_raw_bytes(src_path: str) -> Tuple[bytes, str]:
+    """
+    原图 -> 长边不超过 RAW_DOWNCAST_LONG_EDGE 的 JPEG；结果比原文件还大时返回原 bytes。
+    直接从文件解码，原图 bytes 只在需要回退时才读进内存。
+    """
+    import io
+    try:
+        with Image.open(src_path) as im:
+            im.draft("RGB", (RAW_DOWNCAST_LONG_EDGE, RAW_DOWNCAST_LONG_EDGE))  # JPEG 源图解码时就缩小
+            im.thumbnail((RAW_DOWNCAST_LONG_EDGE, RAW_DOWNCAST_LONG_EDGE), Image.LANCZOS)
+            buf = io.BytesIO()
+            im.convert("RGB").save(buf, format="JPEG", quality=RAW_DOWNCAST_QUALITY, optimize=True)
+    except Exception:
+        return _read_raw_bytes(src_path)
+
+    data = buf.getvalue()
+    if len(data) >= os.path.getsize(src_path):
+        return _read_raw_bytes(src_path)
+    return data, "image/jpeg"
+
+
+def _iter_preprocessed(args: List[Tuple[str, int, str, int]]) -> Iterator[Tuple[bytes, str, Dict[str, Any]]]:
+    return _iter_pool_map(_preprocess_one, args)
+
+
+def _iter_raw_inputs(
+    day_dir: str,
+    images: List[Tuple[datetime, str]],
+    summary: Dict[str, Any]
+) -> Iterator[Tuple[datetime, str, bytes, str]]:
+    """
+    不预处理时逐张读原图；total_out_bytes 边迭代边累加。
+    转 JPEG 是纯 CPU 活，和预处理一样走进程池（按输入顺序产出）。
+    """
+    if RAW_DOWNCAST_JPEG:
+        paths = [os.path.join(day_dir, filename) for _, filename in images]
+        results = _iter_pool_map(_downcast_raw_bytes, paths)
+    else:
+        results = map(_read_raw_bytes, (os.path.join(day_dir, filename) for _, filename in images))
+
+    for (dt_local, filename), (data, mime) in zip(images, results):
+        summary["total_out_bytes"] += len(data)
+        yield dt_local, filename, data, mime
+
+
+def _read_preprocessed_marker(day_dir: str, filenames: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    读融合模式留下的标记；格式和当前 PREPROCESS_FORMAT 不一致就当没有。
+    标记里的文件列表必须覆盖当天所有图片（后来又复制进来的原图不能跳过预处理）。
+    """
+    try:
+        marker = _load_json(os.path.join(day_dir, PREPROCESSED_MARKER))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(marker, dict) or marker.get("format") != PREPROCESS_FORMAT.lower():
+        return None
+    if "target_long_edge" not in marker:
+        return None
+    if not set(filenames).issubset(marker.get("files") or ()):
+        return None
+    return marker
+
+
+def _iter_pool_map(fn: Callable[[Any], Any], args: List[Any]) -> Iterator[Any]:
+    """
+    按输入顺序逐个产出 fn(arg)（fn 要是顶层函数才能 pickle 给子进程）。
+    并行时最多只让 2 倍进程数的任务在飞，已完成但没被消费的图片不会堆满内存。
+    """
+    if len(args) < PREPROCESS_PARALLEL_MIN_IMAGES:
+        yield from map(fn, args)
+        return
+
+    workers = PREPROCESS_WORKERS or os.cpu_count() or 1
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending: Deque[Future] = deque()
+        for a in args:
+            pending.append(ex.submit(fn, a))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
 def _preprocess_day_images(
     day_dir: str,
     images: List[Tuple[datetime, str]]
-) -> Tuple[List[Tuple[datetime, str, bytes, str]], Dict[str, Any]]:
+) -> Tuple[Iterable[Tuple[datetime, str, bytes, str]], Dict[str, Any]]:
     """
     对当天图像做预处理，返回：
-    - processed: [(dt, filename, bytes, mime)]
-    - summary stats
+    - processed: 逐张产出 (dt, filename, bytes, mime) 的迭代器（同一时刻只持有少量图片）
+    - summary stats：边迭代边填，迭代完才完整；dup_of 在对应帧产出前就已写入
     """
     if not images:
         return [], {"note": "no images"}
 
-    first_path = os.path.join(day_dir, images[0][1])
-    screen_w, screen_h = _read_image_size(first_path)
-    target_long_edge = _compute_target_long_edge(screen_w, screen_h)
-
-    processed: List[Tuple[datetime, str, bytes, str]] = []
-    total_src = 0
-    total_out = 0
+    marker = _read_preprocessed_marker(day_dir, [filename for _, filename in images])
+    if marker is not None:
+        # 已经预处理过：沿用当时的目标尺寸，图片都会走原样直通，不再重新编码
+        screen_resolution = str(marker.get("screen_resolution", ""))
+        target_long_edge = int(marker["target_long_edge"])
+    else:
+        first_path = os.path.join(day_dir, images[0][1])
+        screen_w, screen_h = _read_image_size(first_path)
+        screen_resolution = f"{screen_w}x{screen_h}"
+        target_long_edge = _compute_target_long_edge(screen_w, screen_h)
 
     # sample limit
     use_images = images
@@ -264,33 +665,60 @@ def _preprocess_day_images(
         use_images = images[:SAMPLE_LIMIT]
 
     per_image_stats: List[Dict[str, Any]] = []
+    dup_of: Dict[str, str] = {}  # filename -> 复用其结果的帧
 
-    for dt_local, filename in use_images:
-        src_path = os.path.join(day_dir, filename)
-        data, mime, st = _preprocess_image_bytes(
-            src_path=src_path,
-            target_long_edge=target_long_edge,
-            out_format=PREPROCESS_FORMAT,
-            jpeg_quality=JPEG_QUALITY
-        )
-        processed.append((dt_local, filename, data, mime))
-        total_src += int(st["src_bytes"])
-        total_out += int(st["out_bytes"])
-        per_image_stats.append({"filename": filename, **st})
-
-    summary = {
-        "screen_resolution_inferred": f"{screen_w}x{screen_h}",
+    summary: Dict[str, Any] = {
+        "screen_resolution_inferred": screen_resolution,
         "target_long_edge": target_long_edge,
         "preprocess_enabled": True,
+        "already_preprocessed": marker is not None,
         "format": PREPROCESS_FORMAT.lower(),
         "jpeg_quality": JPEG_QUALITY if PREPROCESS_FORMAT.lower() == "jpeg" else None,
-        "image_count_processed": len(processed),
-        "total_src_bytes": total_src,
-        "total_out_bytes": total_out,
-        "compression_ratio": round((total_out / total_src), 4) if total_src > 0 else None,
+        "image_count_processed": 0,
+        "total_src_bytes": 0,
+        "total_out_bytes": 0,
+        "compression_ratio": None,
+        "dedup_skipped": 0,
+        "dup_of": dup_of,
         "per_image": per_image_stats  # 如太啰嗦你可删掉
     }
-    return processed, summary
+
+    args = [
+        (os.path.join(day_dir, filename), target_long_edge, PREPROCESS_FORMAT, JPEG_QUALITY)
+        for _, filename in use_images
+    ]
+
+    def _gen() -> Iterator[Tuple[datetime, str, bytes, str]]:
+        total_src = 0
+        total_out = 0
+        anchors: List[Tuple[int, str]] = []  # 真正送去分析的帧
+        exact: Dict[int, str] = {}
+
+        # 结果保持输入顺序，直接和 use_images 对齐
+        for (dt_local, filename), (data, mime, st) in zip(use_images, _iter_preprocessed(args)):
+            total_src += int(st["src_bytes"])
+            total_out += int(st["out_bytes"])
+            per_image_stats.append({"filename": filename, **st})
+
+            if ENABLE_DEDUP:
+                h = st["dhash"]
+                anchor = _match_anchor(h, anchors, exact)
+                if anchor is not None:
+                    dup_of[filename] = anchor
+                    per_image_stats[-1]["dup_of"] = anchor
+                else:
+                    anchors.append((h, filename))
+                    exact.setdefault(h, filename)
+
+            summary["image_count_processed"] = len(per_image_stats)
+            summary["total_src_bytes"] = total_src
+            summary["total_out_bytes"] = total_out
+            summary["compression_ratio"] = round((total_out / total_src), 4) if total_src > 0 else None
+            summary["dedup_skipped"] = len(dup_of)
+
+            yield dt_local, filename, data, mime
+
+    return _gen(), summary
 
 
 # =======================
@@ -309,11 +737,15 @@ def _normalize_frame_json(raw: Dict[str, Any]) -> Dict[str, Any]:
 
     def _as_list_str(v: Any) -> List[str]:
         if isinstance(v, list):
-            out: List[str] = []
+            seen: Dict[str, None] = {}  # dict 保序去重，凑够 3 个就停
             for item in v:
-                if isinstance(item, str) and item.strip():
-                    out.append(item.strip())
-            return out[:3]
+                if isinstance(item, str):
+                    item = item.strip()
+                    if item:
+                        seen.setdefault(item, None)
+                        if len(seen) == 3:
+                            break
+            return list(seen)
         return []
 
     norm = {
@@ -327,48 +759,332 @@ def _normalize_frame_json(raw: Dict[str, Any]) -> Dict[str, Any]:
     return norm
 
 
-def _call_gemini_for_frame_bytes(
+def _make_genai_client() -> genai.Client:
+    """
+    一天只建一个 client，所有帧共用它的连接池。
+    SDK 走 httpx 时：连接池上限跟并发数对齐；装了 h2 就开 HTTP/2，
+    多个并发请求复用同一条 TLS 连接。装了 aiohttp 时 SDK 改用 aiohttp，参数不适用，保持默认。
+    """
+    async_args: Dict[str, Any] = {}
+    if httpx is not None and not _module_available("aiohttp"):
+        async_args["limits"] = httpx.Limits(
+            max_connections=GEMINI_CONCURRENCY * 2,
+            max_keepalive_connections=GEMINI_CONCURRENCY
+        )
+        if _module_available("h2"):
+            async_args["http2"] = True
+
+    if not async_args:
+        return genai.Client(api_key=GEMINI_API_KEY)
+    return genai.Client(
+        api_key=GEMINI_API_KEY,
+        http_options=types.HttpOptions(async_client_args=async_args)
+    )
+
+
+def _module_available(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+# 网络层异常（超时 / 连接断开 / 协议错误）：SDK 的 httpx / aiohttp 异常都不是 ConnectionError 的子类
+_TRANSPORT_ERRORS: Tuple[type, ...] = (asyncio.TimeoutError, ConnectionError) + tuple(
+    exc for exc in (
+        httpx.TransportError if httpx is not None else None,
+        aiohttp.ClientError if aiohttp is not None else None,
+    ) if exc is not None
+)
+
+
+def _is_transient_error(e: Exception) -> bool:
+    code = e.code if isinstance(e, errors.APIError) else getattr(e, "code", None)
+    if isinstance(code, int):
+        return code in _RETRYABLE_STATUS
+    # 网络层异常没有状态码；消息里只认 RESOURCE_EXHAUSTED（光有 "429" 可能是 token 数 / 请求 id）
+    return isinstance(e, _TRANSPORT_ERRORS) or "RESOURCE_EXHAUSTED" in str(e)
+
+
+def _retry_delay_seconds(e: Exception, attempt: int) -> float:
+    # 429 的报错里常带 "Please retry in XXs"
+    m = re.search(r"Please retry in\s+([0-9.]+)s", str(e))
+    if m:
+        return float(m.group(1))
+    return GEMINI_BACKOFF_BASE_SECONDS * (2 ** attempt) * random.uniform(0.75, 1.25)
+
+
+def _is_rate_limited(e: Exception) -> bool:
+    if isinstance(e, errors.APIError):
+        return e.code == 429
+    return "RESOURCE_EXHAUSTED" in str(e)
+
+
+class _TokenBucket:
+    """每分钟 limit 个令牌，匀速回填；limit <= 0 表示不限"""
+
+    def __init__(self, limit_per_minute: int) -> None:
+        self.capacity = float(limit_per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def wait_seconds(self, amount: float, now: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+        amount = min(amount, self.capacity)  # 单次超过整桶的请求也要能发出去
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        if self.capacity > 0:
+            self.level -= min(amount, self.capacity)
+
+
+class _GeminiPacer:
+    """
+    请求前按 RPM / TPM 两个桶预留额度，不够就等到够为止。
+    收到 429 时占住一半并发名额 GEMINI_RATE_LIMIT_COOLDOWN_SECONDS 秒（并发减半），到期归还。
+    """
+
+    def __init__(self, sem: asyncio.Semaphore) -> None:
+        self.requests = _TokenBucket(GEMINI_RPM_LIMIT)
+        self.tokens = _TokenBucket(GEMINI_TPM_LIMIT)
+        self.sem = sem
+        self.lock = asyncio.Lock()  # 排队按先来后到预留，避免多个请求同时看到“够用”
+        self.cooling: Optional[asyncio.Task] = None
+
+    async def acquire(self, est_tokens: int) -> None:
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                wait = max(self.requests.wait_seconds(1, now), self.tokens.wait_seconds(est_tokens, now))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.requests.take(1)
+            self.tokens.take(est_tokens)
+
+    def on_rate_limited(self) -> None:
+        if self.cooling is None or self.cooling.done():
+            self.cooling = asyncio.create_task(self._hold_half())
+
+    async def _hold_half(self) -> None:
+        held = 0
+        try:
+            for _ in range(GEMINI_CONCURRENCY // 2):
+                await self.sem.acquire()
+                held += 1
+            await asyncio.sleep(GEMINI_RATE_LIMIT_COOLDOWN_SECONDS)
+        finally:
+            for _ in range(held):
+                self.sem.release()
+
+
+def _estimate_request_tokens(prompt: str) -> int:
+    return GEMINI_IMAGE_TOKEN_ESTIMATE + len(prompt) // 4 + GEMINI_OUTPUT_TOKEN_ESTIMATE
+
+
+async def _call_gemini_for_frame_bytes(
     client: genai.Client,
     image_bytes: bytes,
     mime_type: str,
     dt_local: datetime,
-    filename: str
+    filename: str,
+    retry_log: Optional[List[str]] = None,
+    pacer: Optional[_GeminiPacer] = None
 ) -> Dict[str, Any]:
     prompt = _build_frame_prompt(dt_local, filename)
+    est_tokens = _estimate_request_tokens(prompt)
 
-    resp = client.models.generate_content(
-        model=GEMINI_MODEL,
-        contents=[
-            types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
-            prompt
-        ],
-        config=types.GenerateContentConfig(
-            thinking_config=types.ThinkingConfig(thinking_level="low"),
-            temperature=0.0
-        ),
-    )
+    for attempt in range(GEMINI_MAX_ATTEMPTS):
+        if pacer is not None:
+            await pacer.acquire(est_tokens)
+        try:
+            resp = await client.aio.models.generate_content(
+                model=GEMINI_MODEL,
+                contents=[
+                    types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
+                    prompt
+                ],
+                config=_FRAME_CONFIG,
+            )
+            break
+        except Exception as e:
+            if pacer is not None and _is_rate_limited(e):
+                pacer.on_rate_limited()
+            if attempt + 1 >= GEMINI_MAX_ATTEMPTS or not _is_transient_error(e):
+                raise
+            delay = _retry_delay_seconds(e, attempt)
+            if retry_log is not None:
+                retry_log.append(datetime.now().isoformat(timespec="seconds"))
+            print(f"[retry] {filename}: {e.__class__.__name__}, sleeping {delay:.1f}s (attempt {attempt + 1}/{GEMINI_MAX_ATTEMPTS})")
+            await asyncio.sleep(delay)
 
     text = (resp.text or "").strip()
     if not text:
         raise RuntimeError("Empty response from Gemini.")
 
     try:
-        return json.loads(text)
-    except json.JSONDecodeError as e:
+        return orjson.loads(text) if orjson is not None else json.loads(text)
+    except ValueError as e:  # json / orjson 的 JSONDecodeError 都是 ValueError
         raise RuntimeError(f"Gemini did not return valid JSON. Raw text:\n{text}") from e
 
 
+def _load_partial(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    读断点文件：帧内容 key（同 _frame_cache_key）-> raw。
+    按内容而不是文件名续跑：同名文件被替换（重新生成测试日 / 重新截图）时不会沿用旧结果。
+    最后一行可能因为崩溃只写了一半，解析失败的行直接跳过。
+    """
+    done: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(rec, dict) and isinstance(rec.get("raw"), dict) and rec.get("key"):
+                    done[str(rec["key"])] = rec["raw"]
+    except OSError:
+        pass
+    return done
+
+
+def _append_partial(f: IO[str], key: str, dt_local: datetime, filename: str, raw: Dict[str, Any]) -> None:
+    rec = {"key": key, "filename": filename, "dt": dt_local.isoformat(), "raw": raw}
+    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _frame_cache_key(image_bytes: bytes, mime_type: str) -> str:
+    h = hashlib.sha256()
+    h.update(f"{GEMINI_MODEL}|{_PROMPT_HASH}|{mime_type}|".encode("utf-8"))
+    h.update(image_bytes)
+    return h.hexdigest()
+
+
+def _load_frame_cache(path: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        cache = _load_json(path)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def _save_frame_cache(path: str, cache: Dict[str, Dict[str, Any]]) -> None:
+    # 先写临时文件再 os.replace：中途崩溃也不会留下半个 JSON
+    tmp = path + ".tmp"
+    _write_json(tmp, cache, indent=False)
+    os.replace(tmp, path)
+
+
+async def _analyze_frames(
+    client: genai.Client,
+    processed_inputs: Iterable[Tuple[datetime, str, bytes, str]],
+    dup_of: Dict[str, str],
+    cache: Optional[Dict[str, Dict[str, Any]]] = None,
+    resumed: Optional[Dict[str, Dict[str, Any]]] = None,
+    checkpoint: Optional[IO[str]] = None,
+    retry_log: Optional[List[str]] = None
+) -> List[Tuple[datetime, str, Union[Dict[str, Any], BaseException, None]]]:
+    """
+    并发分析所有帧，按输入顺序返回 (dt, filename, raw_json)；重复帧的 raw_json 为 None。
+    - 单帧失败不会拖垮整天：该位置放异常对象，由调用方降级处理
+    - 传入 cache 时先查缓存，命中就不发请求；新结果和断点恢复的结果都写回 cache（由调用方落盘）
+    - resumed：上次中断前已完成的帧（内容 key -> raw）；checkpoint：每帧成功后追加一行并 fsync
+      （放到线程里做，逐个排队写，不让磁盘延迟卡住事件循环上的其他请求）
+    - 同时最多 GEMINI_CONCURRENCY 个请求在飞，图片 bytes 也就只保留这么多份
+    - 临时错误在单帧内部退避重试（见 _call_gemini_for_frame_bytes），不再每帧固定 sleep
+    - 每次请求前按 RPM / TPM 令牌桶预留额度；遇到 429 暂时把并发减半
+    - 预处理迭代器放到线程里取，不阻塞事件循环上正在进行的请求
+    """
+    sem = asyncio.Semaphore(GEMINI_CONCURRENCY)
+    pacer = _GeminiPacer(sem)
+    checkpoint_lock = asyncio.Lock()  # 同一个文件对象，不能多个线程同时写
+    need_key = cache is not None or checkpoint is not None or bool(resumed)
+
+    async def one(img_bytes: bytes, mime: str, dt_local: datetime, filename: str, key: str) -> Dict[str, Any]:
+        try:
+            raw = await _call_gemini_for_frame_bytes(client, img_bytes, mime, dt_local, filename, retry_log, pacer)
+        finally:
+            sem.release()
+        if checkpoint is not None:
+            async with checkpoint_lock:
+                await asyncio.to_thread(_append_partial, checkpoint, key, dt_local, filename, raw)
+        return raw
+
+    it = iter(processed_inputs)
+    # (dt, filename, 缓存 key, 请求 task 或 缓存命中的结果 或 None=重复帧)
+    entries: List[Tuple[datetime, str, str, Union[asyncio.Task, Dict[str, Any], None]]] = []
+    inflight: Dict[str, asyncio.Task] = {}  # 同一次运行里字节相同的帧共用一个请求
+    while True:
+        item = await asyncio.to_thread(next, it, None)
+        if item is None:
+            break
+        dt_local, filename, img_bytes, mime = item
+        if filename in dup_of:
+            entries.append((dt_local, filename, "", None))
+            continue
+
+        key = _frame_cache_key(img_bytes, mime) if need_key else ""
+        if resumed and key in resumed:
+            # 带上 key：和新结果一样写回 cache，之后没有断点文件也不用再调 Gemini
+            entries.append((dt_local, filename, key, resumed[key]))
+            continue
+
+        if cache is not None:
+            hit = cache.get(key) or inflight.get(key)
+            if hit is not None:
+                entries.append((dt_local, filename, key, hit))
+                continue
+
+        await sem.acquire()
+        task = asyncio.create_task(one(img_bytes, mime, dt_local, filename, key))
+        if cache is not None:
+            inflight[key] = task
+        entries.append((dt_local, filename, key, task))
+
+    tasks = [v for _, _, _, v in entries if isinstance(v, asyncio.Task)]
+    results = iter(await asyncio.gather(*tasks, return_exceptions=True))
+    if pacer.cooling is not None:
+        pacer.cooling.cancel()
+
+    # gather 的结果和 tasks 同序，按原始位置放回
+    out: List[Tuple[datetime, str, Union[Dict[str, Any], BaseException, None]]] = []
+    for dt_local, filename, key, v in entries:
+        if isinstance(v, asyncio.Task):
+            v = next(results)
+        # 新结果和断点续跑恢复的结果都写回 cache（重复帧 key 为空，失败的是异常对象）
+        if cache is not None and key and isinstance(v, dict):
+            cache[key] = v
+        out.append((dt_local, filename, v))
+    return out
+
+
+def _frame_seconds(frames: List[FrameResult]) -> List[int]:
+    # 构造时就算好的墙钟秒数：后面只做整数相减，不再逐对创建 timedelta
+    return [fr.dt_epoch for fr in frames]
+
+
 def _detect_gaps(frames: List[FrameResult]) -> List[Dict[str, str]]:
     if not frames:
         return []
-    expected = timedelta(minutes=CAPTURE_INTERVAL_MINUTES)
+    ts = _frame_seconds(frames)
+    limit = CAPTURE_INTERVAL_MINUTES * 60 * 1.5
+    last = ts[-1]
     gaps: List[Dict[str, str]] = []
-    for i in range(1, len(frames)):
-        delta = frames[i].dt - frames[i - 1].dt
-        if delta > expected * 1.5:
+    for i in range(1, len(ts)):
+        # 剩下的时间跨度都不够一个缺口了，后面不可能再有
+        if last - ts[i - 1] <= limit:
+            break
+        if ts[i] - ts[i - 1] > limit:
+            # 只有真正的缺口才格式化时间字符串
             gaps.append({
-                "start_time_local": frames[i - 1].dt.strftime("%H:%M"),
-                "end_time_local": frames[i].dt.strftime("%H:%M"),
+                "start_time_local": frames[i - 1].hhmm,
+                "end_time_local": frames[i].hhmm,
                 "reason": "missing screenshots"
             })
     return gaps
@@ -377,10 +1093,11 @@ def _detect_gaps(frames: List[FrameResult]) -> List[Dict[str, str]]:
 def _estimate_missing_expected(frames: List[FrameResult]) -> int:
     if len(frames) < 2:
         return 0
-    expected = timedelta(minutes=CAPTURE_INTERVAL_MINUTES)
+    ts = _frame_seconds(frames)
+    expected = CAPTURE_INTERVAL_MINUTES * 60
     missing = 0
-    for i in range(1, len(frames)):
-        delta = frames[i].dt - frames[i - 1].dt
+    for prev, cur in zip(ts, ts[1:]):
+        delta = cur - prev
         if delta > expected:
             miss = int(round((delta / expected) - 1))
             if miss > 0:
@@ -388,61 +1105,51 @@ def _estimate_missing_expected(frames: List[FrameResult]) -> int:
     return missing
 
 
-def _merge_frames_into_segments(frames: List[FrameResult]) -> List[Dict[str, Any]]:
-    if not frames:
-        return []
+def _bucket_key(fr: FrameResult) -> Tuple[str, Optional[str]]:
+    return fr.dominant_surface, (fr.activity if MERGE_BY_ACTIVITY_TOO else None)
 
-    segments: List[Dict[str, Any]] = []
 
-    def same_bucket(a: FrameResult, b: FrameResult) -> bool:
-        if a.dominant_surface != b.dominant_surface:
-            return False
-        if MERGE_BY_ACTIVITY_TOO and a.activity != b.activity:
-            return False
-        return True
-
-    start_idx = 0
-    for i in range(1, len(frames) + 1):
-        if i == len(frames) or not same_bucket(frames[i - 1], frames[i]):
-            chunk = frames[start_idx:i]
-            first = chunk[0]
-            last = chunk[-1]
-
-            start_time = first.dt
-            end_time = last.dt + timedelta(minutes=CAPTURE_INTERVAL_MINUTES)
-            duration_minutes = int(round((end_time - start_time).total_seconds() / 60))
-
-            sup: List[str] = []
-            for fr in chunk:
-                for s in fr.supporting_surfaces:
-                    if s not in sup and s != fr.dominant_surface:
-                        sup.append(s)
-            sup = sup[:3]
-
-            avg_conf = sum(fr.confidence for fr in chunk) / max(1, len(chunk))
-
-            risk_flags: List[str] = []
-            if avg_conf < LOW_CONFIDENCE_THRESHOLD:
-                risk_flags.append("low_confidence")
-
-            segments.append({
-                "start_time_local": start_time.strftime("%H:%M"),
-                "end_time_local": end_time.strftime("%H:%M"),
-                "duration_minutes": duration_minutes,
-                "dominant_surface": first.dominant_surface,
-                "activity": first.activity,
-                "context_detail": first.context_detail,
-                "confidence": round(avg_conf, 3),
-                "supporting_surfaces": sup,
-                "evidence_frames": [fr.filename for fr in chunk],
-                "notes": first.notes,
-                "risk_flags": risk_flags or ["none"]
-            })
-
-            start_idx = i
+def _merge_frames_into_segments(frames: List[FrameResult]) -> List[Dict[str, Any]]:
+    segments: List[Dict[str, Any]] = []
 
-    for idx, seg in enumerate(segments, start=1):
-        seg["segment_id"] = f"S{idx:03d}"
+    # 连续同桶的帧一次 groupby 分好组，组内一趟累加
+    for idx, (_, grp) in enumerate(groupby(frames, key=_bucket_key), start=1):
+        chunk = list(grp)
+        first = chunk[0]
+        last = chunk[-1]
+
+        start_time = first.dt
+        end_time = last.dt + CAPTURE_TD
+        duration_minutes = int(round((end_time - start_time).total_seconds() / 60))
+
+        sup: Dict[str, None] = {}  # dict 保序去重
+        conf_sum = 0.0
+        for fr in chunk:
+            conf_sum += fr.confidence
+            for s in fr.supporting_surfaces:
+                sup.setdefault(s, None)
+        sup.pop(first.dominant_surface, None)
+
+        avg_conf = conf_sum / len(chunk)
+
+        risk_flags: List[str] = []
+        if avg_conf < LOW_CONFIDENCE_THRESHOLD:
+            risk_flags.append("low_confidence")
+
+        segments.append({
+            "start_time_local": first.hhmm,
+            "end_time_local": _hhmm(end_time),
+            "duration_minutes": duration_minutes,
+            "dominant_surface": first.dominant_surface,
+            "activity": first.activity,
+            "context_detail": first.context_detail,
+            "confidence": round(avg_conf, 3),
+            "supporting_surfaces": list(sup)[:3],
+            "evidence_frames": [fr.filename for fr in chunk],
+            "notes": first.notes,
+            "risk_flags": risk_flags or ["none"],
+            "segment_id": f"S{idx:03d}"
+        })
 
     return segments
 
@@ -458,35 +1165,30 @@ def _segments_to_human_lines(segments: List[Dict[str, Any]]) -> List[str]:
 
 
 def _build_totals(segments: List[Dict[str, Any]]) -> Dict[str, Any]:
-    by_surface: Dict[str, Dict[str, float]] = {}
-    by_activity: Dict[str, int] = {}
+    by_surface: DefaultDict[str, List[float]] = defaultdict(lambda: [0, 0.0])  # [minutes, conf 加权分钟]
+    by_activity: Counter[str] = Counter()
 
     for seg in segments:
         minutes = int(seg.get("duration_minutes", 0))
         conf = float(seg.get("confidence", 0.0))
-        surface = seg.get("dominant_surface", "Unknown")
-        activity = seg.get("activity", "Other")
-
-        if surface not in by_surface:
-            by_surface[surface] = {"minutes": 0, "confidence_weighted_minutes": 0.0}
-        by_surface[surface]["minutes"] += minutes
-        by_surface[surface]["confidence_weighted_minutes"] += minutes * conf
-
-        by_activity[activity] = by_activity.get(activity, 0) + minutes
-
-    by_surface_list = []
-    for k, v in by_surface.items():
-        by_surface_list.append({
-            "surface": k,
-            "minutes": int(v["minutes"]),
-            "confidence_weighted_minutes": round(v["confidence_weighted_minutes"], 2)
-        })
-    by_surface_list.sort(key=lambda x: x["minutes"], reverse=True)
-
-    by_activity_list = []
-    for k, v in by_activity.items():
-        by_activity_list.append({"activity": k, "minutes": int(v)})
-    by_activity_list.sort(key=lambda x: x["minutes"], reverse=True)
+        acc = by_surface[seg.get("dominant_surface", "Unknown")]
+        acc[0] += minutes
+        acc[1] += minutes * conf
+        by_activity[seg.get("activity", "Other")] += minutes
+
+    by_surface_list = sorted(
+        (
+            {"surface": k, "minutes": int(v[0]), "confidence_weighted_minutes": round(v[1], 2)}
+            for k, v in by_surface.items()
+        ),
+        key=itemgetter("minutes"),
+        reverse=True
+    )
+    by_activity_list = sorted(
+        ({"activity": k, "minutes": int(v)} for k, v in by_activity.items()),
+        key=itemgetter("minutes"),
+        reverse=True
+    )
 
     context_switch_count = max(0, len(segments) - 1)
 
@@ -525,25 +1227,25 @@ def generate_timeline_for_today() -> str:
         # 若 SAMPLE_LIMIT 生效，_preprocess_day_images 已经截断
         processed_inputs = processed
     else:
-        # 不预处理：直接读取原文件 bytes
-        processed_inputs = []
-        for dt_local, filename in use_images:
-            path = os.path.join(day_dir, filename)
-            with open(path, "rb") as f:
-                data = f.read()
-            ext = os.path.splitext(filename)[1]
-            mime = _mime_type_for_ext(ext)
-            processed_inputs.append((dt_local, filename, data, mime))
-
+        # 不预处理：直接用原文件 bytes，逐张惰性读取（只有在飞的请求持有图片）
         preprocess_summary = {
             "preprocess_enabled": False,
-            "image_count_processed": len(processed_inputs),
-            "total_out_bytes": sum(len(x[2]) for x in processed_inputs),
+            "image_count_processed": len(use_images),
+            "total_src_bytes": sum(os.path.getsize(os.path.join(day_dir, fn)) for _, fn in use_images),
+            "total_out_bytes": 0,
+            "raw_downcast": {
+                "long_edge": RAW_DOWNCAST_LONG_EDGE,
+                "jpeg_quality": RAW_DOWNCAST_QUALITY
+            } if RAW_DOWNCAST_JPEG else None,
             "note": "using original images"
         }
+        processed_inputs = _iter_raw_inputs(day_dir, use_images, preprocess_summary)
 
     # DRY RUN：只看压缩结果，不消耗 token
     if DRY_RUN:
+        # 预处理结果是惰性的：跑完一遍统计才完整
+        for _ in processed_inputs:
+            pass
         report = {
             "date_local": day_date.strftime("%Y-%m-%d"),
             "day_folder": day_dir,
@@ -552,8 +1254,7 @@ def generate_timeline_for_today() -> str:
         }
         out_name = f"dryrun_preprocess_{day_date.strftime('%Y-%m-%d')}.json"
         out_path = os.path.join(day_dir, out_name)
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
+        _write_json(out_path, report)
 
         print(f"DRY_RUN saved: {out_path}")
         print("Key stats:")
@@ -564,16 +1265,50 @@ def generate_timeline_for_today() -> str:
         print(f"- compression ratio : {preprocess_summary.get('compression_ratio')}")
         return out_path
 
-    # 调 Gemini
-    client = genai.Client(api_key=GEMINI_API_KEY)
+    # 调 Gemini（异步并发）
+    client = _make_genai_client()
+
+    # 和预处理共用同一个 dict：每帧产出前它的 dup_of 就已经写进去了
+    dup_of: Dict[str, str] = preprocess_summary.get("dup_of", {})
+    cache_path = os.path.join(day_dir, FRAME_CACHE_FILENAME)
+    cache = _load_frame_cache(cache_path) if USE_FRAME_CACHE else None
+    retry_log: List[str] = []  # 每次重试的时间
+    partial_path = os.path.join(day_dir, PARTIAL_FILENAME)
+    resumed = _load_partial(partial_path)
+    if resumed:
+        print(f"Resuming: {len(resumed)} frames already analyzed in {partial_path}")
+    with open(partial_path, "a", encoding="utf-8") as checkpoint:
+        if checkpoint.tell():
+            checkpoint.write("\n")  # 上次崩溃可能留下没换行的半行，先断开（空行读取时会跳过）
+        analyzed = asyncio.run(
+            _analyze_frames(client, processed_inputs, dup_of, cache, resumed, checkpoint, retry_log)
+        )
+    if cache is not None:
+        _save_frame_cache(cache_path, cache)
+
+    failures = [raw for _, _, raw in analyzed if isinstance(raw, BaseException)]
+    if failures and len(failures) == sum(1 for _, _, raw in analyzed if raw is not None):
+        # 一帧都没成功：多半是 key / 网络问题，直接报第一个错
+        raise failures[0]
 
     frame_results: List[FrameResult] = []
+    by_filename: Dict[str, FrameResult] = {}
+    for dt_local, filename, raw in analyzed:
+        if raw is None:
+            # 和之前分析过的某一帧几乎一样：沿用它的结果，只换时间和文件名
+            fr = replace(by_filename[dup_of[filename]], dt=dt_local, filename=filename)
+            frame_results.append(fr)
+            by_filename[filename] = fr
+            continue
 
-    for dt_local, filename, img_bytes, mime in processed_inputs:
-        raw = _call_gemini_for_frame_bytes(client, img_bytes, mime, dt_local, filename)
-        norm = _normalize_frame_json(raw)
+        if isinstance(raw, BaseException):
+            # 单帧失败：记成 Unknown / 置信度 0（合并时会被标 low_confidence）
+            print(f"[WARN] Gemini failed on {filename}: {raw}")
+            norm = _normalize_frame_json({"notes": f"analysis failed: {raw}"})
+        else:
+            norm = _normalize_frame_json(raw)
 
-        frame_results.append(FrameResult(
+        fr = FrameResult(
             dt=dt_local,
             filename=filename,
             dominant_surface=norm["dominant_surface"],
@@ -582,9 +1317,9 @@ def generate_timeline_for_today() -> str:
             confidence=norm["confidence"],
             supporting_surfaces=norm["supporting_surfaces"],
             notes=norm["notes"]
-        ))
-
-        time.sleep(REQUEST_SLEEP_SECONDS)
+        )
+        frame_results.append(fr)
+        by_filename[filename] = fr
 
     segments = _merge_frames_into_segments(frame_results)
     timeline_lines = _segments_to_human_lines(segments)
@@ -606,6 +1341,9 @@ def generate_timeline_for_today() -> str:
         "data_quality": {
             "image_count": len(frame_results),
             "missing_expected_images": missing_expected,
+            "failed_frames": len(failures),
+            "gemini_retries": len(retry_log),
+            "last_retry_at": retry_log[-1] if retry_log else None,
             "gaps": gaps
         },
 
@@ -614,8 +1352,13 @@ def generate_timeline_for_today() -> str:
 
     out_name = f"timeline_{day_date.strftime('%Y-%m-%d')}.json"
     out_path = os.path.join(day_dir, out_name)
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    _write_json(out_path, output)
+
+    # 结果已完整落盘，断点文件没用了
+    try:
+        os.remove(partial_path)
+    except OSError:
+        pass
 
     return out_path
 
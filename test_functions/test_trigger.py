@@ -2,6 +2,11 @@ import json
 from dataclasses import dataclass, asdict
 from typing import Any, Dict, List, Optional, Tuple
 
+try:
+    import orjson  # optional: faster JSON output
+except ImportError:
+    orjson = None
+
 
 # -----------------------------
 # Time utils
@@ -85,29 +90,78 @@ def infer_project_id(seg: Dict[str, Any]) -> Optional[str]:
 # Cooldown manager
 # -----------------------------
 
+NEVER_SENT = -10**9  # minute_of_day sentinel: "never sent" passes any cooldown
+
 class CooldownTracker:
+    """
+    Last-sent minute_of_day per trigger, as plain int fields.
+    Detectors check `now_min - cd.<trigger>_at >= cooldown` inline.
+    """
+    __slots__ = ("first_work_at", "focus_at", "return_to_work_at", "anomaly_at")
+
     def __init__(self):
-        self.last_sent_at: Dict[str, int] = {}  # key -> minute_of_day
+        self.first_work_at = NEVER_SENT
+        self.focus_at: List[int] = [NEVER_SENT] * 3  # index = focus level - 1 (L1..L3)
+        self.return_to_work_at = NEVER_SENT
+        self.anomaly_at = NEVER_SENT
+
+
+# -----------------------------
+# Segment prep
+# -----------------------------
+
+def _prepare_one(seg: Dict[str, Any]) -> Dict[str, Any]:
+    # shallow copy with parsed times / work flag
+    s = dict(seg)
+    s["_start_min"] = start_min = parse_hhmm(s["start_time_local"])
+    s["_end_min"] = end_min = parse_hhmm(s["end_time_local"])
+    s["_is_work"] = infer_is_work(s)
+    s["_dur"] = int(s.get("duration_minutes", max(0, end_min - start_min)))
+    return s
+
+
+def prepare_segments(segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Parse times / work flag once per segment so detectors don't redo it.
+    Works on shallow copies; the caller's timeline is left untouched.
+    """
+    prepared = [_prepare_one(seg) for seg in segments]
+    prepared.sort(key=lambda s: s["_start_min"])
+    return prepared
 
-    def can_send(self, key: str, now_min: int, cooldown_min: int) -> bool:
-        last = self.last_sent_at.get(key)
-        if last is None:
-            return True
-        return (now_min - last) >= cooldown_min
 
-    def mark_sent(self, key: str, now_min: int):
-        self.last_sent_at[key] = now_min
+def _segments_to_arrays(segments: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    """
+    Column view of segments (one list per field, same order),
+    so the detector loops zip over flat lists instead of doing dict lookups.
+    Raw timeline segments are parsed here (order kept); prepare_segments output is used as is.
+    """
+    if segments and "_start_min" not in segments[0]:
+        segments = [_prepare_one(seg) for seg in segments]
+    return {
+        "segment_id": [s.get("segment_id","") for s in segments],
+        "start_min": [s["_start_min"] for s in segments],
+        "end_min": [s["_end_min"] for s in segments],
+        "dur": [s["_dur"] for s in segments],
+        "is_work": [s["_is_work"] for s in segments],
+        # bit k = segment k is work (single int, any length)
+        "work_bits": sum(1 << k for k, s in enumerate(segments) if s["_is_work"]),
+    }
 
 
 # -----------------------------
 # Trigger detectors
 # -----------------------------
 
-def detect_first_work(segments: List[Dict[str, Any]], cd: CooldownTracker) -> List[FeedbackEvent]:
-    for seg in segments:
-        if infer_is_work(seg):
-            start_min = parse_hhmm(seg["start_time_local"])
-            if cd.can_send("first_work", start_min, 24 * 60):
+def detect_first_work(
+    segments: List[Dict[str, Any]],
+    cd: CooldownTracker,
+    cols: Optional[Dict[str, List[Any]]] = None
+) -> List[FeedbackEvent]:
+    cols = cols or _segments_to_arrays(segments)
+    for seg, start_min, is_work in zip(segments, cols["start_min"], cols["is_work"]):
+        if is_work:
+            if start_min - cd.first_work_at >= 24 * 60:
                 ui = FeedbackUI(type="corner_bubble", ttl_sec=6, can_close=True, intensity="light")
                 ev = FeedbackEvent(
                     event_id=f"firstwork_{seg.get('segment_id','')}",
@@ -122,82 +176,110 @@ def detect_first_work(segments: List[Dict[str, Any]], cd: CooldownTracker) -> Li
                     confidence=0.75,
                     cooldown_minutes=24 * 60
                 )
-                cd.mark_sent("first_work", start_min)
+                cd.first_work_at = start_min
                 return [ev]
             break
     return []
 
+def _focus_scan(
+    end_min: List[int],
+    dur: List[int],
+    is_work: List[bool],
+    thresholds: List[int],
+    last_at: List[int],
+    cooldown_min: int = 30
+) -> List[Tuple[int, int, int]]:
+    """
+    Numeric core of focus detection: ints in, ints out, no dicts or strings.
+    Returns (segment index, threshold index, chain start index) per crossing.
+    Updates last_at (per-level last-sent minute) in place.
+    """
+    hits: List[Tuple[int, int, int]] = []
+    n_th = len(thresholds)
+    consecutive = 0
+    emitted = 0          # bit i set -> level i already fired in this chain
+    chain_start = -1
+
+    for j in range(len(end_min)):
+        if not is_work[j]:
+            # Break focus chain
+            consecutive = 0
+            emitted = 0
+            chain_start = -1
+            continue
+
+        if chain_start < 0:
+            chain_start = j
+        consecutive += dur[j]
+        now = end_min[j]
+        for i in range(n_th):
+            if consecutive >= thresholds[i] and not (emitted >> i) & 1 and now - last_at[i] >= cooldown_min:
+                hits.append((j, i, chain_start))
+                last_at[i] = now
+                emitted |= 1 << i
+
+    return hits
+
 def detect_focus_levels(
     segments: List[Dict[str, Any]],
     cd: CooldownTracker,
-    thresholds: List[int] = [15, 25, 40]
+    thresholds: List[int] = [15, 25, 40],
+    cols: Optional[Dict[str, List[Any]]] = None
 ) -> List[FeedbackEvent]:
     """
     Continuous focus encouragement:
       - When consecutive work minutes crosses 15/25/40 -> L1/L2/L3
     """
     events: List[FeedbackEvent] = []
-    consecutive = 0
-    emitted = set()
-    chain_ids: List[str] = []
-    cur_project: Optional[str] = None
-
-    for seg in segments:
-        s_id = seg.get("segment_id","")
-        start_min = parse_hhmm(seg["start_time_local"])
-        end_min = parse_hhmm(seg["end_time_local"])
-        dur = int(seg.get("duration_minutes", max(0, end_min - start_min)))
-
-        if infer_is_work(seg):
-            consecutive += dur
-            chain_ids.append(s_id)
-            cur_project = infer_project_id(seg) or cur_project
-
-            for i, th in enumerate(thresholds):
-                level = f"L{i+1}"
-                key = f"focus_{level}"
-                if consecutive >= th and level not in emitted and cd.can_send(key, end_min, 30):
-                    ui = FeedbackUI(
-                        type="corner_bubble",
-                        ttl_sec=6,
-                        can_close=True,
-                        intensity="light" if level == "L1" else "medium"
-                    )
-                    msg = {
-                        "L1": f"你已经连续专注了 {th} 分钟，节奏很稳。",
-                        "L2": f"专注到 {th} 分钟了！继续保持这个状态。",
-                        "L3": f"你已经专注了 {th} 分钟，今天的推进很扎实。",
-                    }[level]
-
-                    ev = FeedbackEvent(
-                        event_id=f"focus_{s_id}_{level}",
-                        time_local=seg["end_time_local"],
-                        time_minute_of_day=end_min,
-                        trigger_type="focus",
-                        level=level,
-                        ui=ui,
-                        message=msg,
-                        evidence_segment_ids=chain_ids[-6:],
-                        project_id=cur_project,
-                        confidence=0.85,
-                        cooldown_minutes=30
-                    )
-                    events.append(ev)
-                    cd.mark_sent(key, end_min)
-                    emitted.add(level)
-        else:
-            # Break focus chain
-            consecutive = 0
-            emitted.clear()
-            chain_ids = []
-            cur_project = None
+    cols = cols or _segments_to_arrays(segments)
+    seg_ids = cols["segment_id"]
+
+    hits = _focus_scan(cols["end_min"], cols["dur"], cols["is_work"], thresholds, cd.focus_at)
+    for j, i, chain_start in hits:
+        seg = segments[j]
+        th = thresholds[i]
+        level = f"L{i+1}"
+
+        # Latest project id seen in the chain so far
+        cur_project: Optional[str] = None
+        for k in range(j, chain_start - 1, -1):
+            cur_project = infer_project_id(segments[k])
+            if cur_project:
+                break
+
+        ui = FeedbackUI(
+            type="corner_bubble",
+            ttl_sec=6,
+            can_close=True,
+            intensity="light" if level == "L1" else "medium"
+        )
+        msg = {
+            "L1": f"你已经连续专注了 {th} 分钟，节奏很稳。",
+            "L2": f"专注到 {th} 分钟了！继续保持这个状态。",
+            "L3": f"你已经专注了 {th} 分钟，今天的推进很扎实。",
+        }[level]
+
+        events.append(FeedbackEvent(
+            event_id=f"focus_{seg_ids[j]}_{level}",
+            time_local=seg["end_time_local"],
+            time_minute_of_day=cols["end_min"][j],
+            trigger_type="focus",
+            level=level,
+            ui=ui,
+            message=msg,
+            evidence_segment_ids=seg_ids[max(chain_start, j - 5):j + 1],
+            project_id=cur_project or None,
+            confidence=0.85,
+            cooldown_minutes=30
+        ))
 
     return events
 
 def detect_return_to_work(
     segments: List[Dict[str, Any]],
     cd: CooldownTracker,
-    min_offwork_minutes: int = 5
+    min_offwork_minutes: int = 5,
+    cols: Optional[Dict[str, List[Any]]] = None
 ) -> List[FeedbackEvent]:
     """
     Off-work >= 5 minutes then return to work -> L2 toast
@@ -207,18 +289,16 @@ def detect_return_to_work(
     off_ids: List[str] = []
     was_off = False
 
-    for seg in segments:
-        s_id = seg.get("segment_id","")
-        start_min = parse_hhmm(seg["start_time_local"])
-        end_min = parse_hhmm(seg["end_time_local"])
-        dur = int(seg.get("duration_minutes", max(0, end_min - start_min)))
-
-        if not infer_is_work(seg):
+    cols = cols or _segments_to_arrays(segments)
+    for seg, s_id, start_min, dur, is_work in zip(
+        segments, cols["segment_id"], cols["start_min"], cols["dur"], cols["is_work"]
+    ):
+        if not is_work:
             was_off = True
             off_min += dur
             off_ids.append(s_id)
         else:
-            if was_off and off_min >= min_offwork_minutes and cd.can_send("return_to_work", start_min, 30):
+            if was_off and off_min >= min_offwork_minutes and start_min - cd.return_to_work_at >= 30:
                 ui = FeedbackUI(type="toast", ttl_sec=6, can_close=True, intensity="medium")
                 msg = f"欢迎回来～你刚刚离开工作页面 {off_min} 分钟，继续把这一段收尾就很棒。"
                 ev = FeedbackEvent(
@@ -235,7 +315,7 @@ def detect_return_to_work(
                     cooldown_minutes=30
                 )
                 events.append(ev)
-                cd.mark_sent("return_to_work", start_min)
+                cd.return_to_work_at = start_min
 
             # reset
             was_off = False
@@ -248,57 +328,52 @@ def detect_anomaly_switching(
     segments: List[Dict[str, Any]],
     cd: CooldownTracker,
     window_minutes: int = 60,
-    switch_threshold: int = 6
+    switch_threshold: int = 6,
+    cols: Optional[Dict[str, List[Any]]] = None
 ) -> List[FeedbackEvent]:
     """
     1 hour window: work/non-work switches >= threshold -> candidate anomaly trigger
     """
     events: List[FeedbackEvent] = []
 
-    switches = 0
-    prev: Optional[bool] = None
-    window_start: Optional[int] = None
-    window_ids: List[str] = []
-
-    for seg in segments:
-        s_id = seg.get("segment_id","")
-        start_min = parse_hhmm(seg["start_time_local"])
-        end_min = parse_hhmm(seg["end_time_local"])
-        cur = infer_is_work(seg)
-
-        if window_start is None:
-            window_start = start_min
-
-        window_ids.append(s_id)
-        if prev is not None and cur != prev:
-            switches += 1
-        prev = cur
-
-        if end_min - window_start >= window_minutes:
-            if switches >= switch_threshold and cd.can_send("anomaly_switching", end_min, 60):
-                ui = FeedbackUI(type="toast", ttl_sec=6, can_close=True, intensity="medium")
-                msg = "你这一小时切换有点频繁，先选一个最小任务推进 10 分钟，会更轻松。"
-                ev = FeedbackEvent(
-                    event_id=f"anomaly_{s_id}",
-                    time_local=seg["end_time_local"],
-                    time_minute_of_day=end_min,
-                    trigger_type="anomaly",
-                    level="L2",
-                    ui=ui,
-                    message=msg,
-                    evidence_segment_ids=window_ids[-12:],
-                    project_id=None,
-                    confidence=0.7,
-                    cooldown_minutes=60
-                )
-                events.append(ev)
-                cd.mark_sent("anomaly_switching", end_min)
-
-            # reset window
-            switches = 0
-            prev = None
-            window_start = None
-            window_ids = []
+    cols = cols or _segments_to_arrays(segments)
+    seg_ids = cols["segment_id"]
+    start_min = cols["start_min"]
+    end_min = cols["end_min"]
+
+    # Bit k of `flips` is set when segment k and k+1 differ in work/non-work,
+    # so switches inside a window [i, j] is a popcount over bits i..j-1.
+    work_bits = cols["work_bits"]
+    flips = work_bits ^ (work_bits >> 1)
+
+    i = 0  # first segment of the current window
+    for j in range(len(segments)):
+        now = end_min[j]
+        if now - start_min[i] < window_minutes:
+            continue
+
+        switches = ((flips >> i) & ((1 << (j - i)) - 1)).bit_count()
+        if switches >= switch_threshold and now - cd.anomaly_at >= 60:
+            ui = FeedbackUI(type="toast", ttl_sec=6, can_close=True, intensity="medium")
+            msg = "你这一小时切换有点频繁，先选一个最小任务推进 10 分钟，会更轻松。"
+            ev = FeedbackEvent(
+                event_id=f"anomaly_{seg_ids[j]}",
+                time_local=segments[j]["end_time_local"],
+                time_minute_of_day=now,
+                trigger_type="anomaly",
+                level="L2",
+                ui=ui,
+                message=msg,
+                evidence_segment_ids=seg_ids[max(i, j - 11):j + 1],
+                project_id=None,
+                confidence=0.7,
+                cooldown_minutes=60
+            )
+            events.append(ev)
+            cd.anomaly_at = now
+
+        # reset window: next segment starts a new one
+        i = j + 1
 
     return events
 
@@ -308,16 +383,16 @@ def detect_anomaly_switching(
 # -----------------------------
 
 def generate_feedback_events(day_timeline: Dict[str, Any]) -> Dict[str, Any]:
-    segments = day_timeline.get("timeline_segments", [])
-    segments = sorted(segments, key=lambda s: parse_hhmm(s["start_time_local"]))
+    segments = prepare_segments(day_timeline.get("timeline_segments", []))
+    cols = _segments_to_arrays(segments)
 
     cd = CooldownTracker()
 
     candidates: List[FeedbackEvent] = []
-    candidates += detect_first_work(segments, cd)
-    candidates += detect_focus_levels(segments, cd, thresholds=[15, 25, 40])
-    candidates += detect_return_to_work(segments, cd, min_offwork_minutes=5)
-    candidates += detect_anomaly_switching(segments, cd)
+    candidates += detect_first_work(segments, cd, cols=cols)
+    candidates += detect_focus_levels(segments, cd, thresholds=[15, 25, 40], cols=cols)
+    candidates += detect_return_to_work(segments, cd, min_offwork_minutes=5, cols=cols)
+    candidates += detect_anomaly_switching(segments, cd, cols=cols)
 
     final_events: List[FeedbackEvent] = []
     for ev in candidates:
@@ -341,6 +416,15 @@ def generate_feedback_events(day_timeline: Dict[str, Any]) -> Dict[str, Any]:
 # CLI
 # -----------------------------
 
+def _write_json(path: str, obj: Dict[str, Any]) -> None:
+    if orjson is not None:
+        with open(path, "wb") as f:
+            f.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+
+
 def main():
     import argparse
     parser = argparse.ArgumentParser()
@@ -353,8 +437,7 @@ def main():
 
     out = generate_feedback_events(day_timeline)
 
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
+    _write_json(args.out, out)
 
     print(f"[OK] wrote {args.out} with {len(out['feedback_events'])} events")
 